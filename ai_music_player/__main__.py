@@ -23,8 +23,10 @@ AI 音乐播放器 MCP 服务器
 import os
 import sys
 import random
-import time
-from pathlib import Path
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
 
 # 抑制 pygame 欢迎信息
@@ -42,12 +44,50 @@ import config
 from database.models import init_db, Music
 from database import db as database_db
 
+# 模块日志：stdio 模式下 stdout 是 MCP 协议通道，后台线程的错误写入日志（默认输出到 stderr）
+logger = logging.getLogger(__name__)
+
 # ==================== MCP 服务器初始化 ====================
 
 # 创建 FastMCP 服务器实例
 # MCP 是一种协议，允许 AI 模型与外部服务交互
 mcp = FastMCP("AI Music Player")
 
+# 预读线程：在当前歌曲播放时提前把下一首读入系统页缓存
+_PREFETCH_EXEC = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+# 不支持 posix_fadvise 的平台上预读的字节数
+_PREFETCH_BYTES = 4 * 1024 * 1024
+
+# 检测歌曲播放结束的轮询间隔（秒）
+# get_busy() 只读取 mixer 状态，开销可以忽略；间隔越短，自动切歌的停顿越短
+_END_POLL_INTERVAL = 0.1
+
+# 随机播放时记录的已播放歌曲数量（供"上一首"回退）
+_HISTORY_SIZE = 50
+
+
+def _warm_cache(file_path: str):
+    """
+    预读音乐文件到系统页缓存
+
+    切歌时 pygame 同步加载文件，冷缓存会带来明显的停顿
+    Linux 上使用 posix_fadvise(WILLNEED) 触发内核预读，不会阻塞；
+    其他平台读取文件开头的若干字节后丢弃
+
+    Args:
+        file_path: 音乐文件的绝对路径
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                f.read(_PREFETCH_BYTES)
+    except OSError:
+        # 预读只是优化，失败时忽略
+        pass
+
 # ==================== 全局播放器实例 ====================
 
 # 全局单例播放器实例
@@ -75,13 +115,13 @@ def get_player():
         # - size: 采样位数，-16 表示 16 位有符号
         # - channels: 声道数，2 表示立体声
         # - buffer: 缓冲区大小，越大越稳定但延迟越高
-        try:
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-        except Exception:
-            # 如果高级参数失败，使用默认参数
-            pygame.mixer.init()
+        #   2048 个采样约 46ms，对音乐播放不可感知，且比 512 更不容易断音、CPU 占用更低
+        # 参数均为标准配置，初始化失败时直接抛出异常，便于发现音频设备问题
+        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=2048)
 
         # 创建播放器实例
+        # 在第一次需要播放器时才创建（而不是在 main() 中），
+        # 只使用查询类工具（列表、搜索、偏好）时不会打开音频设备
         _player = MusicPlayer()
 
     return _player
@@ -99,22 +139,37 @@ class MusicPlayer:
         """
         初始化播放器
 
-        设置默认状态，创建后台监控线程
+        设置默认状态（后台监控线程在第一次播放时创建）
         """
         import pygame
 
         # 保存 pygame 模块引用（懒加载）
         self._pygame = pygame
 
+        # 播放状态查询函数（监控线程和状态查询频繁调用，绑定一次省去逐级属性查找）
+        self._get_busy = pygame.mixer.music.get_busy
+
         # 当前播放的音乐文件路径
         self.current_track = None
 
+        # 当前音乐文件名（不含路径和扩展名），加载时计算一次
+        self._current_track_stem = None
+
         # 播放列表（Music 对象列表）
         self.playlist: List[Music] = []
 
         # 当前播放的索引位置
         self.current_index = 0
 
+        # 随机播放模式：不打乱列表，每次切歌时随机选取下一首
+        self._shuffled = False
+
+        # 已选定的下一首索引（播放开始时确定，供预读和切歌共用）
+        self._upcoming_index = None
+
+        # 随机播放时已播放歌曲的索引，"上一首"从这里取出
+        self._history = deque(maxlen=_HISTORY_SIZE)
+
         # 播放状态标志
         self.is_playing = False      # 是否正在播放
         self.is_paused = False       # 是否已暂停
@@ -123,50 +178,97 @@ class MusicPlayer:
         self.volume = config.DEFAULT_VOLUME
         pygame.mixer.music.set_volume(self.volume)
 
-        # 启动后台线程：监控播放状态，歌曲结束后自动播放下一首
-        import threading
-        self._monitor_thread = threading.Thread(target=self._monitor_playback, daemon=True)
-        self._monitor_thread.start()
+        # 歌曲结束信号：由轮询线程置位，监控线程阻塞等待
+        self._track_end = threading.Event()
 
         # 记录上一次的播放状态（用于检测播放结束）
         self._last_busy_state = False
 
-    def _monitor_playback(self):
+        # 后台线程在第一次播放时才启动（见 _start_monitor）
+        # 只使用查询类工具时不会创建线程
+        self._poll_thread = None
+        self._monitor_thread = None
+        self._monitor_lock = threading.Lock()
+
+        # 切歌锁：自动切歌与手动切歌互斥
+        self._advancing = threading.Lock()
+
+    def _start_monitor(self):
         """
-        后台线程：监控播放状态
+        启动后台监控线程（仅第一次调用时生效）
 
-        每秒检查一次播放状态
-        当检测到歌曲播放结束时（从 playing 变为 stopped）
-        自动切换到播放列表中的下一首
+        - 轮询线程：检测播放结束，置位 _track_end
+        - 监控线程：等待 _track_end，歌曲结束后自动播放下一首
+        """
+        if self._monitor_thread is not None:
+            return
+        with self._monitor_lock:
+            if self._monitor_thread is not None:
+                return
+            self._poll_thread = threading.Thread(target=self._poll_track_end, daemon=True)
+            self._poll_thread.start()
+            self._monitor_thread = threading.Thread(target=self._monitor_playback, daemon=True)
+            self._monitor_thread.start()
+
+    def _poll_track_end(self):
+        """
+        后台线程：检测歌曲播放结束
 
-        注意：这是一个死循环线程，在程序结束前一直运行
-        daemon=True 确保主程序结束时自动终止此线程
+        每 _END_POLL_INTERVAL 秒检查一次 get_busy()，从"正在播放"变为"停止"时
+        置位 _track_end，唤醒监控线程
+
+        服务器只初始化了 mixer，pygame 的事件队列依赖视频子系统，
+        收不到播放结束事件，因此使用短间隔轮询（这是唯一的歌曲结束检测方式）
         """
         import time
         while True:
             try:
-                pygame = self._py()
-                is_busy = pygame.mixer.music.get_busy()
-
+                is_busy = self._get_busy()
                 # 检测播放结束：从"正在播放"变为"停止"
-                if self._last_busy_state and not is_busy and not self.is_paused:
-                    # 歌曲已结束，检查是否需要自动播放下一首
-                    if self.playlist and len(self.playlist) > 1:
-                        # 只有当播放列表有多于一首歌时才自动播放下一首
-                        self.current_index = (self.current_index + 1) % len(self.playlist)
-                        self.play_current()
-                    else:
-                        # 只有一首歌或最后一首，播放完毕后停止
-                        self.is_playing = False
-
-                # 更新状态
+                if self._last_busy_state and not is_busy:
+                    self._track_end.set()
                 self._last_busy_state = is_busy
             except Exception:
-                # 忽略所有异常，避免线程崩溃
                 pass
+            time.sleep(_END_POLL_INTERVAL)
 
-            # 每秒检查一次
-            time.sleep(1)
+    def _monitor_playback(self):
+        """
+        后台线程：监控播放状态
+
+        阻塞等待轮询线程置位的歌曲结束信号（_track_end）
+        当歌曲播放结束时自动切换到播放列表中的下一首
+
+        注意：这是一个死循环线程，在程序结束前一直运行
+        daemon=True 确保主程序结束时自动终止此线程
+        """
+        while True:
+            self._track_end.wait()
+            self._track_end.clear()
+
+            # 正在手动切歌（next/previous）时，本次结束事件正是切歌引起的，直接忽略
+            # 同时避免连续的结束事件导致重复切歌
+            if not self._advancing.acquire(blocking=False):
+                continue
+            try:
+                # stop()、切歌也会触发结束事件，需要排除：
+                # 已停止、已暂停，或新歌曲已经开始播放时不做处理
+                if not self.is_playing or self.is_paused or self._get_busy():
+                    continue
+
+                # 歌曲已结束，检查是否需要自动播放下一首
+                if self.playlist and len(self.playlist) > 1:
+                    # 只有当播放列表有多于一首歌时才自动播放下一首
+                    self._advance_index()
+                    self.play_current()
+                else:
+                    # 只有一首歌或最后一首，播放完毕后停止
+                    self.is_playing = False
+            except Exception:
+                # 不让异常终止线程，但要记录错误和调用栈以便排查
+                logger.exception("Error advancing track")
+            finally:
+                self._advancing.release()
 
     def _py(self):
         """
@@ -197,6 +299,7 @@ class MusicPlayer:
         try:
             pygame.mixer.music.load(file_path)
             self.current_track = file_path
+            self._current_track_stem = os.path.splitext(os.path.basename(file_path))[0]
             return True
         except Exception as e:
             print(f"Error loading {file_path}: {e}")
@@ -213,13 +316,11 @@ class MusicPlayer:
         """
         pygame = self._py()
         try:
-            # 设置播放结束事件（用于检测歌曲播放完毕）
-            pygame.mixer.music.set_endevent(pygame.USEREVENT)
             pygame.mixer.music.play()
             self.is_playing = True
             self.is_paused = False
-            # 短暂等待，让 pygame 有时间启动
-            time.sleep(0.5)
+            self._start_monitor()
+            # pygame.mixer.music.play() 本身是非阻塞的，无需等待启动
             return True
         except Exception as e:
             print(f"Error playing: {e}")
@@ -236,7 +337,7 @@ class MusicPlayer:
         """
         pygame = self._py()
         try:
-            is_busy = pygame.mixer.music.get_busy()
+            is_busy = self._get_busy()
             if is_busy:
                 pygame.mixer.music.pause()
                 self.is_paused = True
@@ -265,7 +366,7 @@ class MusicPlayer:
                 pygame.mixer.music.unpause()
                 self.is_paused = False
                 return True
-            elif not pygame.mixer.music.get_busy():
+            elif not self._get_busy():
                 # 没有在播放，尝试重新播放当前歌曲
                 return self.play_current()
             return False
@@ -288,6 +389,8 @@ class MusicPlayer:
             self.is_playing = False
             self.is_paused = False
             self.current_index = 0  # 重置播放索引
+            self._upcoming_index = None
+            self._history.clear()
             # 重置播放状态，避免后台线程误判为播放结束而重新播放
             self._last_busy_state = False
             return True
@@ -300,31 +403,45 @@ class MusicPlayer:
         播放下一首
 
         循环播放：播放完最后一首后回到第一首
+        随机播放模式下随机选取下一首
 
         Returns:
             bool: 操作是否成功
         """
         if not self.playlist:
             return False
-        # 使用模运算实现循环
-        self.current_index = (self.current_index + 1) % len(self.playlist)
-        self._setup_endevent()
-        return self.play_current()
+        with self._advancing:
+            self._advance_index()
+            return self.play_current()
 
     def previous(self) -> bool:
         """
         播放上一首
 
         循环播放：播放完第一首后回到最后一首
+        随机播放模式下回到之前实际播放过的那一首
 
         Returns:
             bool: 操作是否成功
         """
         if not self.playlist:
             return False
-        self.current_index = (self.current_index - 1) % len(self.playlist)
-        self._setup_endevent()
-        return self.play_current()
+        with self._advancing:
+            if self._shuffled and self._history:
+                self.current_index = self._history.pop()
+            else:
+                self.current_index = (self.current_index - 1) % len(self.playlist)
+            return self.play_current()
+
+    def _advance_index(self):
+        """
+        切换到下一首的索引
+
+        随机播放时先记录当前索引，"上一首"可以按播放顺序回退
+        """
+        if self._shuffled:
+            self._history.append(self.current_index)
+        self.current_index = self._take_upcoming_index()
 
     def play_current(self) -> bool:
         """
@@ -336,19 +453,68 @@ class MusicPlayer:
         if not self.playlist:
             return False
         track = self.playlist[self.current_index]
-        if self.load(track.file_path):
-            return self.play()
+        if self.load(track.file_path) and self.play():
+            self._upcoming_index = self._pick_next_index()
+            self._prefetch_next()
+            return True
         return False
 
+    def _pick_next_index(self) -> int:
+        """
+        选取下一首的索引
+
+        顺序播放时为当前索引加一（循环）
+        随机播放时从其余歌曲中随机选取一首，O(1) 完成，无需打乱整个列表
+
+        Returns:
+            int: 下一首在播放列表中的索引
+        """
+        size = len(self.playlist)
+        if self._shuffled and size > 1:
+            # 偏移 1 ~ size-1，保证不会连续播放同一首
+            return (self.current_index + random.randrange(1, size)) % size
+        return (self.current_index + 1) % size
+
+    def _take_upcoming_index(self) -> int:
+        """
+        取出已选定的下一首索引
+
+        优先使用播放开始时选定（并已预读）的索引，没有时现场选取
+
+        Returns:
+            int: 下一首在播放列表中的索引
+        """
+        index = self._upcoming_index
+        self._upcoming_index = None
+        if index is None or index >= len(self.playlist):
+            index = self._pick_next_index()
+        return index
+
+    def _prefetch_next(self):
+        """
+        在后台预读播放列表中的下一首歌曲
+
+        减少自动切歌时加载文件造成的间隔
+        """
+        if len(self.playlist) < 2 or self._upcoming_index is None:
+            return
+        next_track = self.playlist[self._upcoming_index]
+        _PREFETCH_EXEC.submit(_warm_cache, next_track.file_path)
+
     def set_playlist(self, tracks: List[Music]):
         """
         设置播放列表
 
+        数据库查询返回的列表直接使用，不再复制；其他可迭代对象转换为列表
+
         Args:
             tracks: Music 对象列表
         """
-        self.playlist = list(tracks)
+        self.playlist = tracks if type(tracks) is list else list(tracks)
         self.current_index = 0
+        self._shuffled = False
+        self._upcoming_index = None
+        self._history.clear()
 
     def play_track(self, track: Music) -> bool:
         """
@@ -360,7 +526,7 @@ class MusicPlayer:
         Returns:
             bool: 操作是否成功
         """
-        self.current_track = track.file_path
+        # load() 负责记录 current_track 及文件名缓存
         if self.load(track.file_path):
             return self.play()
         return False
@@ -375,58 +541,61 @@ class MusicPlayer:
         if not self.playlist:
             return False
         self.current_index = 0
-        self._setup_endevent()
+        self._shuffled = False
+        self._history.clear()
         return self.play_current()
 
     def shuffle_play(self) -> bool:
         """
         随机播放
 
-        随机打乱播放列表后播放
+        从随机位置开始播放，之后每次切歌随机选取下一首
+        不打乱播放列表本身
 
         Returns:
             bool: 操作是否成功
         """
         if not self.playlist:
             return False
-        random.shuffle(self.playlist)
-        self.current_index = 0
-        self._setup_endevent()
+        self.current_index = random.randrange(len(self.playlist))
+        self._shuffled = True
+        self._history.clear()
         return self.play_current()
 
-    def _setup_endevent(self):
+    @property
+    def volume(self) -> float:
         """
-        设置播放结束事件
+        当前音量 (0.0 ~ 1.0)
 
-        用于检测歌曲播放完毕，触发自动播放下一首
+        内部以整数百分比保存，反复增减音量不会累积浮点误差（如 0.7 + 0.1 得到 0.7999...）
         """
-        pygame = self._py()
-        try:
-            pygame.mixer.music.set_endevent(pygame.USEREVENT)
-        except Exception as e:
-            print(f"Error setting up endevent: {e}")
+        return self._volume_percent / 100
 
-    def _check_and_play_next(self) -> bool:
+    @volume.setter
+    def volume(self, value: float):
+        # 限制在有效范围内 (0 ~ 100)
+        self._volume_percent = max(0, min(100, round(value * 100)))
+
+    @property
+    def volume_percent(self) -> int:
+        """当前音量百分比 (0 ~ 100)，对外展示时直接使用，不再由浮点数换算"""
+        return self._volume_percent
+
+    def _apply_volume_percent(self, percent: int) -> float:
         """
-        检查并播放下一首
+        按百分比设置音量并应用到 mixer
 
-        由播放结束事件触发
+        Args:
+            percent: 音量百分比（会被限制在 0 ~ 100）
 
         Returns:
-            bool: 是否成功播放下一首
+            float: 实际设置的音量值 (0.0 ~ 1.0)
         """
-        if not self.playlist:
-            return False
-
         pygame = self._py()
-        try:
-            # 检查是否有歌曲结束事件
-            for event in pygame.event.get():
-                if event.type == pygame.USEREVENT:
-                    return self.next()
-        except Exception:
-            pass
-        return False
+        self._volume_percent = max(0, min(100, percent))
+        volume = self.volume
+        pygame.mixer.music.set_volume(volume)
+        return volume
 
     def set_volume(self, volume: float) -> float:
         """
@@ -436,13 +605,9 @@ class MusicPlayer:
             volume: 音量值 (0.0 ~ 1.0)
 
         Returns:
-            float: 实际设置的音量值
+            float: 实际设置的音量值（精确到 1%）
         """
-        pygame = self._py()
-        # 限制在有效范围内
-        self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
-        return self.volume
+        return self._apply_volume_percent(round(volume * 100))
 
     def volume_up(self) -> float:
         """
@@ -453,7 +618,7 @@ class MusicPlayer:
         Returns:
             float: 调整后的音量值
         """
-        return self.set_volume(self.volume + 0.1)
+        return self._apply_volume_percent(self._volume_percent + 10)
 
     def volume_down(self) -> float:
         """
@@ -464,7 +629,7 @@ class MusicPlayer:
         Returns:
             float: 调整后的音量值
         """
-        return self.set_volume(self.volume - 0.1)
+        return self._apply_volume_percent(self._volume_percent - 10)
 
     def get_status(self) -> dict:
         """
@@ -484,12 +649,51 @@ class MusicPlayer:
             'is_playing': self.is_playing,
             'is_paused': self.is_paused,
             'current_track': self.current_track,
-            'current_track_name': Path(self.current_track).stem if self.current_track else None,
+            'current_track_name': self._current_track_stem,
             'volume': self.volume,
             'playlist_size': len(self.playlist),
             'current_index': self.current_index
         }
 
+    def get_detailed_status(self) -> dict:
+        """
+        获取详细播放状态
+
+        一次性构建 get_player_status 工具所需的全部信息
+
+        Returns:
+            dict: 包含播放状态的字典:
+                - is_playing: 是否正在播放
+                - is_paused: 是否已暂停
+                - is_busy: 是否有声音输出
+                - current_track: 当前歌曲信息（title, artist, album, year），无则为 None
+                - volume: 当前音量百分比 (0 ~ 100)
+                - playlist_size: 播放列表中的歌曲数量
+                - current_index: 当前播放的索引位置
+        """
+        playlist = self.playlist
+        index = self.current_index
+
+        current_track_info = None
+        if index < len(playlist):
+            track = playlist[index]
+            current_track_info = {
+                'title': track.title,
+                'artist': track.artist,
+                'album': track.album,
+                'year': track.year
+            }
+
+        return {
+            'is_playing': self.is_playing,
+            'is_paused': self.is_paused,
+            'is_busy': self.is_busy(),
+            'current_track': current_track_info,
+            'volume': self._volume_percent,
+            'playlist_size': len(playlist),
+            'current_index': index
+        }
+
     def is_busy(self) -> bool:
         """
         检查是否正在播放
@@ -497,9 +701,8 @@ class MusicPlayer:
         Returns:
             bool: 是否正在播放（有声音输出）
         """
-        pygame = self._py()
         try:
-            return pygame.mixer.music.get_busy() > 0
+            return bool(self._get_busy())
         except Exception:
             return False
 
@@ -579,12 +782,11 @@ def __system_instruction__() -> str:
 def play_artist(artist: str) -> str:
     try:
         player = get_player()
-        tracks = database_db.get_music_by_artist(artist)
+        tracks = database_db.get_music_rows(artist=artist)
         if tracks:
             player.set_playlist(tracks)
             success = player.shuffle_play()
-            for track in tracks[:5]:
-                database_db.record_play(track.id)
+            database_db.queue_plays([t.id for t in tracks[:5]])
 
             status = player.get_status()
             current = status.get('current_track_name', 'Unknown')
@@ -612,12 +814,11 @@ def play_artist(artist: str) -> str:
 """)
 def play_song(title: str) -> str:
     player = get_player()
-    tracks = database_db.get_music_by_title(title)
+    tracks = database_db.get_music_rows(title=title)
     if tracks:
         player.set_playlist(tracks)
         player.play_all()
-        for track in tracks[:3]:
-            database_db.record_play(track.id)
+        database_db.queue_plays([t.id for t in tracks[:3]])
         return f"正在播放: {tracks[0].title} - {tracks[0].artist or '未知艺术家'}"
     return f"未找到歌曲: {title}"
 
@@ -637,12 +838,11 @@ def play_song(title: str) -> str:
 """)
 def play_genre(genre: str) -> str:
     player = get_player()
-    tracks = database_db.get_music_by_genre(genre)
+    tracks = database_db.get_music_rows(genre=genre)
     if tracks:
         player.set_playlist(tracks)
         player.shuffle_play()
-        for track in tracks[:5]:
-            database_db.record_play(track.id)
+        database_db.queue_plays([t.id for t in tracks[:5]])
         return f"正在播放{genre}音乐，共 {len(tracks)} 首"
     return f"未找到{genre}类型的歌曲"
 
@@ -663,13 +863,11 @@ def play_decade(decade: int) -> str:
     player = get_player()
     decade_start = int(decade)
     decade_end = decade_start + 9
-    tracks = database_db.get_all_music()
-    filtered = [t for t in tracks if t.year and decade_start <= t.year <= decade_end]
+    filtered = database_db.get_music_rows(year_range=(decade_start, decade_end))
     if filtered:
         player.set_playlist(filtered)
         player.shuffle_play()
-        for track in filtered[:5]:
-            database_db.record_play(track.id)
+        database_db.queue_plays([t.id for t in filtered[:5]])
         return f"正在播放{decade}年代的音乐，共 {len(filtered)} 首"
     return f"未找到{decade}年代的歌曲"
 
@@ -688,12 +886,11 @@ def play_decade(decade: int) -> str:
 """)
 def play_album(album: str) -> str:
     player = get_player()
-    tracks = database_db.get_music_by_album(album)
+    tracks = database_db.get_music_rows(album=album)
     if tracks:
         player.set_playlist(tracks)
         player.play_all()
-        for track in tracks[:5]:
-            database_db.record_play(track.id)
+        database_db.queue_plays([t.id for t in tracks[:5]])
         return f"正在播放专辑《{album}》，共 {len(tracks)} 首"
     return f"未找到专辑: {album}"
 
@@ -712,7 +909,7 @@ def play_random() -> str:
     track = database_db.get_random_music()
     if track:
         player.play_track(track)
-        database_db.record_play(track.id)
+        database_db.queue_plays([track.id])
         return f"随机播放: {track.title} - {track.artist or '未知艺术家'}"
     return "没有可播放的歌曲"
 
@@ -733,13 +930,12 @@ def play_random() -> str:
 def smart_recommend(context: Optional[str] = "") -> str:
     player = get_player()
     prefs = database_db.get_user_preferences()
-    tracks = database_db.get_recommended_tracks(limit=10)
+    tracks = database_db.get_recommended_tracks(limit=10, prefs=prefs)
 
     if tracks:
         player.set_playlist(tracks)
         player.shuffle_play()
-        for track in tracks[:5]:
-            database_db.record_play(track.id)
+        database_db.queue_plays([t.id for t in tracks[:5]])
 
         reasons = []
         if prefs['top_artists']:
@@ -860,8 +1056,8 @@ def previous_track() -> str:
 """)
 def volume_up() -> str:
     player = get_player()
-    vol = player.volume_up()
-    return f"音量: {int(vol * 100)}%"
+    player.volume_up()
+    return f"音量: {player.volume_percent}%"
 
 
 @mcp.tool(description="""
@@ -876,8 +1072,8 @@ def volume_up() -> str:
 """)
 def volume_down() -> str:
     player = get_player()
-    vol = player.volume_down()
-    return f"音量: {int(vol * 100)}%"
+    player.volume_down()
+    return f"音量: {player.volume_percent}%"
 
 
 @mcp.tool(description="""
@@ -894,8 +1090,8 @@ def volume_down() -> str:
 """)
 def set_volume(volume: float) -> str:
     player = get_player()
-    vol = player.set_volume(float(volume))
-    return f"音量: {int(vol * 100)}%"
+    player.set_volume(float(volume))
+    return f"音量: {player.volume_percent}%"
 
 
 @mcp.tool(description="""
@@ -910,29 +1106,10 @@ def set_volume(volume: float) -> str:
 💡 提示：当你不知道用户想做什么时，可以先调用此工具了解当前状态。
 """)
 def get_player_status() -> dict:
-    player = get_player()
-    status = player.get_status()
-    is_busy = player.is_busy()
-
-    current_track_info = None
-    if status['playlist_size'] > 0 and status['current_index'] < len(player.playlist):
-        track = player.playlist[status['current_index']]
-        current_track_info = {
-            'title': track.title,
-            'artist': track.artist,
-            'album': track.album,
-            'year': track.year
-        }
-
-    return {
-        'is_playing': status['is_playing'],
-        'is_paused': status['is_paused'],
-        'is_busy': is_busy,
-        'current_track': current_track_info,
-        'volume': int(status['volume'] * 100),
-        'playlist_size': status['playlist_size'],
-        'current_index': status['current_index'] + 1
-    }
+    status = get_player().get_detailed_status()
+    # 对外展示：索引从 1 开始（音量已是百分比）
+    status['current_index'] += 1
+    return status
 
 
 @mcp.tool(description="""
@@ -976,23 +1153,17 @@ def list_genres(limit: int = 20) -> List[str]:
 - keyword: 搜索关键词，会在歌曲名和歌手中搜索
 """)
 def search_songs(keyword: str) -> List[dict]:
-    tracks = database_db.get_music_by_title(keyword)
-    artist_tracks = database_db.get_music_by_artist(keyword)
-
-    seen_ids = set()
-    results = []
-    for track in tracks + artist_tracks:
-        if track.id not in seen_ids:
-            seen_ids.add(track.id)
-            results.append({
-                'title': track.title,
-                'artist': track.artist,
-                'album': track.album,
-                'year': track.year,
-                'duration': track.duration
-            })
-
-    return results[:20]
+    tracks = database_db.search_music(keyword, limit=20)
+    return [
+        {
+            'title': track.title,
+            'artist': track.artist,
+            'album': track.album,
+            'year': track.year,
+            'duration': track.duration
+        }
+        for track in tracks
+    ]
 
 
 @mcp.tool(description="""
@@ -10,10 +10,13 @@ import os
 from pathlib import Path
 
 # 从 .env 文件加载环境变量
-# 必须在使用 os.getenv 之前调用
+# 必须在读取环境变量之前调用
 from dotenv import load_dotenv
 load_dotenv()
 
+# 环境变量读取函数（绑定到局部名称，下面多次使用）
+_env = os.environ.get
+
 # ==================== 项目路径配置 ====================
 
 # 项目根目录（config.py 在 ai_music_player 包中，需要取父目录的父目录）
@@ -27,17 +30,26 @@ else:
     # 已安装的包：使用当前目录
     BASE_DIR = _config_dir
 
+
+def _resolve_path(value):
+    """将配置中的路径解析为 Path：绝对路径直接使用，相对路径基于 BASE_DIR"""
+    path = Path(value)
+    return path if path.is_absolute() else BASE_DIR / path
+
+
 # 音乐文件存放目录
 # 可通过环境变量 MUSIC_DIR 自定义，默认为项目根目录下的 music 文件夹
 # 支持绝对路径和相对路径（相对于 BASE_DIR）
-_music_path = os.getenv("MUSIC_DIR", "music")
-MUSIC_DIR = Path(_music_path) if Path(_music_path).is_absolute() else BASE_DIR / _music_path
+MUSIC_DIR = _resolve_path(_env("MUSIC_DIR") or "music")
+# 字符串形式，供 os.walk 等直接使用，避免每次转换
+MUSIC_DIR_STR = os.fspath(MUSIC_DIR)
 
 # SQLite 数据库文件路径
 # 可通过环境变量 DATABASE_PATH 自定义，默认为项目根目录下的 music.db
 # 支持绝对路径和相对路径（相对于 BASE_DIR）
-_db_path = os.getenv("DATABASE_PATH", "music.db")
-DATABASE_PATH = Path(_db_path) if Path(_db_path).is_absolute() else BASE_DIR / _db_path
+DATABASE_PATH = _resolve_path(_env("DATABASE_PATH") or "music.db")
+# 字符串形式，供数据库连接使用
+DATABASE_PATH_STR = os.fspath(DATABASE_PATH)
 
 # ==================== 支持的音频格式 ====================
 
@@ -53,4 +65,4 @@ SUPPORTED_FORMATS = [".mp3", ".flac", ".wav", ".m4a", ".ogg"]
 
 # 默认音量 (0.0 ~ 1.0)
 # 可通过环境变量 DEFAULT_VOLUME 自定义，0.0 表示静音，1.0 表示最大音量
-DEFAULT_VOLUME = float(os.getenv("DEFAULT_VOLUME", "0.7"))
+DEFAULT_VOLUME = float(_env("DEFAULT_VOLUME") or 0.7)
@@ -13,12 +13,171 @@
 作者: AI Assistant
 """
 
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
 from datetime import datetime, timezone
+from functools import lru_cache
 
 # SQLAlchemy 聚合函数（用于 count, sum 等）
-from sqlalchemy import func
+from sqlalchemy import Integer, bindparam, case, cast, column, func, or_, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from database.models import Music, PlayHistory, UserPreference, get_session
+from database.models import Music, PlayHistory, UserPreference, get_session, new_session, fts_enabled
+
+# 模块日志：后台写入线程的错误不能写到 stdout（stdio 模式下是 MCP 协议通道）
+logger = logging.getLogger(__name__)
+
+
+# trigram 全文索引只能匹配长度不少于 3 个字符的关键词
+_FTS_MIN_LENGTH = 3
+
+# 批量写入时每条语句的记录数（受 SQLite 单条语句参数个数限制）
+_BULK_BATCH_SIZE = 500
+
+# 后台写入播放记录时，每个事务最多包含的播放数和等待凑批的时间（秒）
+_PLAY_BATCH_SIZE = 500
+_PLAY_BATCH_WINDOW = 0.5
+
+
+# ==================== 辅助函数 ====================
+
+# 播放列表需要的列：播放器只读取这些字段，不需要完整的 ORM 对象
+_PLAYLIST_COLUMNS = (
+    Music.id, Music.file_path, Music.title, Music.artist,
+    Music.album, Music.year, Music.duration,
+)
+
+
+# 查询语句只构造一次并缓存：参数通过 bindparam 在执行时传入，
+# 省去每次调用时构造表达式和计算缓存键的开销，编译结果由 SQLAlchemy 按语句复用
+
+@lru_cache(maxsize=None)
+def _match_condition(columns, use_fts):
+    """
+    构造文本模糊匹配条件（按列和匹配方式缓存）
+
+    参数名以列名为前缀（如 artist_query、title_artist_pattern），
+    多个匹配条件可以组合在同一条语句中
+
+    Args:
+        columns: 要匹配的列名元组
+        use_fts: 是否通过全文索引匹配
+
+    Returns:
+        SQLAlchemy 过滤条件
+    """
+    key = "_".join(columns)
+    if use_fts:
+        matched_ids = text(
+            f"SELECT rowid FROM music_fts WHERE music_fts MATCH :{key}_query"
+        ).columns(column('rowid'))
+        return Music.id.in_(matched_ids)
+
+    # ilike 是大小写不敏感的 LIKE 查询
+    pattern = bindparam(f"{key}_pattern")
+    return or_(*(getattr(Music, name).ilike(pattern) for name in columns))
+
+
+def _text_match(keyword, *columns):
+    """
+    构造文本模糊匹配条件及其参数
+
+    全文索引可用且关键词足够长时，通过 music_fts 倒排索引查找，
+    否则退化为 ILIKE '%keyword%' 全表扫描，两者匹配结果一致
+
+    Args:
+        keyword: 搜索关键词
+        *columns: 要匹配的列名（title, artist, album）
+
+    Returns:
+        tuple: (SQLAlchemy 过滤条件, 执行参数字典)
+    """
+    key = "_".join(columns)
+    if fts_enabled() and len(keyword) >= _FTS_MIN_LENGTH:
+        # FTS5 查询语法：{列1 列2} : "短语"，短语中的双引号需要转义
+        phrase = keyword.replace('"', '""')
+        query = f'{{{" ".join(columns)}}} : "{phrase}"'
+        return _match_condition(columns, True), {f"{key}_query": query}
+
+    return _match_condition(columns, False), {f"{key}_pattern": f"%{keyword}%"}
+
+
+@lru_cache(maxsize=None)
+def _select_music(*conditions):
+    """构造按条件查询 Music 的语句（按条件缓存）"""
+    return select(Music).where(*conditions)
+
+
+# 风格、年份的查询条件
+_GENRE_MATCH = Music.genre.ilike(bindparam('genre_pattern'))
+_YEAR_EQUALS = Music.year == bindparam('year')
+_YEAR_BETWEEN = Music.year.between(bindparam('start'), bindparam('end'))
+
+
+# 缓存的最大歌曲 ID（随机抽样用），None 表示需要重新查询
+_max_music_id = None
+
+
+def clear_library_cache():
+    """
+    清除依赖音乐库内容的缓存（歌手/风格列表、最大歌曲 ID）
+
+    音乐库发生变化（添加、删除歌曲）时调用
+    """
+    global _max_music_id
+    _max_music_id = None
+    get_all_artists.cache_clear()
+    get_all_genres.cache_clear()
+
+
+def _get_max_music_id(session):
+    """
+    获取最大歌曲 ID（带缓存）
+
+    Args:
+        session: 数据库会话
+
+    Returns:
+        int: 最大歌曲 ID，音乐库为空时为 0
+    """
+    global _max_music_id
+    if _max_music_id is None:
+        _max_music_id = session.query(func.max(Music.id)).scalar() or 0
+    return _max_music_id
+
+
+def _sample_music(session, limit):
+    """
+    随机抽取若干首音乐
+
+    在 1 ~ 最大 ID 之间随机抽取 ID 后按主键查询，避免 ORDER BY RANDOM()
+    对全表排序；删除歌曲留下的 ID 空洞导致数量不足时，退回 ORDER BY RANDOM()
+
+    Args:
+        session: 数据库会话
+        limit: 抽取数量
+
+    Returns:
+        List[Row]: 随机的音乐记录列表（列见 _PLAYLIST_COLUMNS）
+    """
+    max_id = _get_max_music_id(session)
+    if not max_id:
+        return []
+
+    # 多抽一些 ID，弥补 ID 空洞
+    ids = random.sample(range(1, max_id + 1), min(max_id, limit * 2))
+    tracks = session.execute(select(*_PLAYLIST_COLUMNS).where(Music.id.in_(ids))).all()
+    if len(tracks) < limit:
+        return session.execute(
+            select(*_PLAYLIST_COLUMNS).order_by(func.random()).limit(limit)
+        ).all()
+
+    random.shuffle(tracks)
+    return tracks[:limit]
 
 
 # ==================== 音乐管理函数 ====================
@@ -62,25 +221,121 @@ def add_music(file_path, title, artist=None, album=None, year=None, genre=None,
         )
         session.add(music)
         session.commit()
+        clear_library_cache()
         return music
     finally:
         session.close()
 
 
-def get_all_music():
+def add_music_bulk(rows, update_existing=False):
     """
-    获取所有音乐记录
+    批量添加音乐到数据库
+
+    已存在的音乐（file_path 相同）默认被跳过，update_existing 为 True 时用新数据覆盖
+    所有记录在同一个事务中写入，每批一条 INSERT 语句
+
+    Args:
+        rows: 字典列表，键与 add_music 的参数相同（file_path 必填，各记录的键需一致），
+              可以额外包含 mtime
+        update_existing: 是否更新已存在的记录，默认 False
 
     Returns:
-        List[Music]: 所有音乐记录的列表
+        int: 实际新增（或更新）的歌曲数量
+    """
+    if not rows:
+        return 0
+
+    session = get_session()
+    try:
+        added = 0
+        for start in range(0, len(rows), _BULK_BATCH_SIZE):
+            batch = rows[start:start + _BULK_BATCH_SIZE]
+
+            if update_existing:
+                # ON CONFLICT DO UPDATE：已存在的文件用新的元数据覆盖
+                insert = sqlite_insert(Music).values(batch)
+                result = session.execute(insert.on_conflict_do_update(
+                    index_elements=['file_path'],
+                    set_={key: insert.excluded[key] for key in batch[0] if key != 'file_path'}
+                ))
+                added += result.rowcount
+                continue
+
+            # 一次查询找出已存在的文件
+            existing = set(session.scalars(
+                select(Music.file_path).where(Music.file_path.in_([r['file_path'] for r in batch]))
+            ))
+            new_rows = [r for r in batch if r['file_path'] not in existing]
+            if not new_rows:
+                continue
+
+            # ON CONFLICT DO NOTHING：并发写入或批内重复路径时不报错
+            result = session.execute(
+                sqlite_insert(Music).values(new_rows).on_conflict_do_nothing(index_elements=['file_path'])
+            )
+            added += result.rowcount
+        session.commit()
+
+        if added:
+            clear_library_cache()
+        return added
+    finally:
+        session.close()
+
+
+def get_file_mtimes():
+    """
+    获取所有已入库文件的修改时间
+
+    用于重新扫描时跳过未修改的文件
+
+    Returns:
+        dict: {file_path: mtime}，尚未记录修改时间的文件为 None
     """
     session = get_session()
     try:
-        return session.query(Music).all()
+        return dict(session.execute(select(Music.file_path, Music.mtime)).all())
+    finally:
+        session.close()
+
+
+# 逐批遍历音乐库时每批读取的记录数
+_ITER_BATCH_SIZE = 1000
+
+
+def iter_all_music(batch_size=_ITER_BATCH_SIZE):
+    """
+    逐批遍历所有音乐记录
+
+    每次只从数据库读取 batch_size 条记录，内存占用与音乐库大小无关；
+    使用独立的会话，遍历期间可以调用其他数据库函数
+
+    Args:
+        batch_size: 每批读取的记录数，默认 1000
+
+    Yields:
+        Music: 音乐记录
+    """
+    session = new_session()
+    try:
+        stmt = select(Music).execution_options(yield_per=batch_size)
+        yield from session.execute(stmt).scalars()
     finally:
         session.close()
 
 
+def get_all_music():
+    """
+    获取所有音乐记录
+
+    音乐库较大且只需逐条处理时，使用 iter_all_music 代替
+
+    Returns:
+        List[Music]: 所有音乐记录的列表
+    """
+    return list(iter_all_music())
+
+
 def get_music_by_artist(artist):
     """
     按艺术家搜索音乐（模糊匹配，大小写不敏感）
@@ -93,8 +348,8 @@ def get_music_by_artist(artist):
     """
     session = get_session()
     try:
-        # ilike 是大小写不敏感的 LIKE 查询
-        return session.query(Music).filter(Music.artist.ilike(f"%{artist}%")).all()
+        condition, params = _text_match(artist, 'artist')
+        return session.execute(_select_music(condition), params).scalars().all()
     finally:
         session.close()
 
@@ -111,7 +366,8 @@ def get_music_by_album(album):
     """
     session = get_session()
     try:
-        return session.query(Music).filter(Music.album.ilike(f"%{album}%")).all()
+        condition, params = _text_match(album, 'album')
+        return session.execute(_select_music(condition), params).scalars().all()
     finally:
         session.close()
 
@@ -128,7 +384,9 @@ def get_music_by_genre(genre):
     """
     session = get_session()
     try:
-        return session.query(Music).filter(Music.genre.ilike(f"%{genre}%")).all()
+        return session.execute(
+            _select_music(_GENRE_MATCH), {'genre_pattern': f"%{genre}%"}
+        ).scalars().all()
     finally:
         session.close()
 
@@ -145,7 +403,27 @@ def get_music_by_year(year):
     """
     session = get_session()
     try:
-        return session.query(Music).filter(Music.year == year).all()
+        return session.execute(_select_music(_YEAR_EQUALS), {'year': year}).scalars().all()
+    finally:
+        session.close()
+
+
+def get_music_by_year_range(start, end):
+    """
+    按发行年份区间查询（包含两端）
+
+    Args:
+        start: 起始年份（如 1980）
+        end: 结束年份（如 1989）
+
+    Returns:
+        List[Music]: 该年份区间内的音乐列表
+    """
+    session = get_session()
+    try:
+        return session.execute(
+            _select_music(_YEAR_BETWEEN), {'start': start, 'end': end}
+        ).scalars().all()
     finally:
         session.close()
 
@@ -162,7 +440,86 @@ def get_music_by_title(title):
     """
     session = get_session()
     try:
-        return session.query(Music).filter(Music.title.ilike(f"%{title}%")).all()
+        condition, params = _text_match(title, 'title')
+        return session.execute(_select_music(condition), params).scalars().all()
+    finally:
+        session.close()
+
+
+@lru_cache(maxsize=None)
+def _select_rows(*conditions):
+    """构造按条件查询播放列表列的语句（按条件缓存）"""
+    return select(*_PLAYLIST_COLUMNS).where(*conditions)
+
+
+def get_music_rows(artist=None, album=None, genre=None, title=None, year_range=None):
+    """
+    按条件查询用于播放的轻量记录（多个条件同时满足）
+
+    只查询播放所需的列并返回 Row 元组，省去 ORM 对象的构造和
+    identity map 登记；Row 支持属性访问（row.title, row.file_path），
+    可以直接作为播放列表使用。需要修改记录时使用 get_music_by_* 系列
+
+    Args:
+        artist: 艺术家名称关键词
+        album: 专辑名称关键词
+        genre: 风格关键词
+        title: 歌曲标题关键词
+        year_range: 发行年份区间 (起始年份, 结束年份)，包含两端
+
+    Returns:
+        List[Row]: 包含 id, file_path, title, artist, album, year, duration 的记录列表
+    """
+    conditions = []
+    params = {}
+    for keyword, name in ((artist, 'artist'), (album, 'album'), (title, 'title')):
+        if keyword:
+            condition, match_params = _text_match(keyword, name)
+            conditions.append(condition)
+            params.update(match_params)
+    if genre:
+        conditions.append(_GENRE_MATCH)
+        params['genre_pattern'] = f"%{genre}%"
+    if year_range:
+        conditions.append(_YEAR_BETWEEN)
+        params['start'], params['end'] = year_range
+
+    session = get_session()
+    try:
+        return session.execute(_select_rows(*conditions), params).all()
+    finally:
+        session.close()
+
+
+@lru_cache(maxsize=None)
+def _search_statement(condition):
+    """构造搜索语句（按匹配条件缓存），标题匹配的结果排在前面"""
+    title_match = Music.title.ilike(bindparam('title_first'))
+    return select(Music).where(condition).order_by(
+        title_match.desc(), Music.id
+    ).limit(bindparam('limit'))
+
+
+def search_music(keyword, limit=20):
+    """
+    按关键词搜索歌曲标题和艺术家（模糊匹配）
+
+    一次查询同时匹配标题和艺术家，标题匹配的结果排在前面
+    全文索引可用时走 FTS5 索引
+
+    Args:
+        keyword: 搜索关键词
+        limit: 返回的最大数量，默认 20
+
+    Returns:
+        List[Music]: 匹配的音乐列表
+    """
+    session = get_session()
+    try:
+        condition, params = _text_match(keyword, 'title', 'artist')
+        params['title_first'] = f"%{keyword}%"
+        params['limit'] = limit
+        return session.execute(_search_statement(condition), params).scalars().all()
     finally:
         session.close()
 
@@ -178,8 +535,17 @@ def get_random_music():
     """
     session = get_session()
     try:
-        # SQLite 使用 RANDOM() 函数随机排序
-        return session.query(Music).order_by(func.random()).first()
+        max_id = _get_max_music_id(session)
+        if not max_id:
+            return None
+
+        # 随机取一个 ID，返回不小于它的第一首（按主键查找，无需全表排序）
+        # 随机 ID 之后都是空洞时，回到第一首
+        random_id = random.randint(1, max_id)
+        music = session.query(Music).filter(Music.id >= random_id).order_by(Music.id).first()
+        if music is None:
+            music = session.query(Music).order_by(Music.id).first()
+        return music
     finally:
         session.close()
 
@@ -200,6 +566,7 @@ def delete_music(file_path):
         if music:
             session.delete(music)
             session.commit()
+            clear_library_cache()
             return True
         return False
     finally:
@@ -208,37 +575,93 @@ def delete_music(file_path):
 
 # ==================== 列表查询函数 ====================
 
+@lru_cache(maxsize=1)
 def get_all_artists():
     """
     获取所有艺术家列表（去重）
 
+    结果会被缓存，直到音乐库发生变化（见 clear_library_cache）
+    返回的列表为共享对象，调用方不应修改
+
     Returns:
         List[str]: 艺术家名称列表
     """
     session = get_session()
     try:
-        # distinct() 去重，然后过滤掉 None 值
-        return [m.artist for m in session.query(Music.artist).distinct().all() if m.artist]
+        # 在 SQL 中去重并过滤空值，使用 Core select 跳过 ORM 行对象构造
+        stmt = select(Music.artist).where(Music.artist.isnot(None), Music.artist != "").distinct()
+        return session.execute(stmt).scalars().all()
     finally:
         session.close()
 
 
+@lru_cache(maxsize=1)
 def get_all_genres():
     """
     获取所有音乐风格列表（去重）
 
+    结果会被缓存，直到音乐库发生变化（见 clear_library_cache）
+    返回的列表为共享对象，调用方不应修改
+
     Returns:
         List[str]: 风格名称列表
     """
     session = get_session()
     try:
-        return [m.genre for m in session.query(Music.genre).distinct().all() if m.genre]
+        stmt = select(Music.genre).where(Music.genre.isnot(None), Music.genre != "").distinct()
+        return session.execute(stmt).scalars().all()
     finally:
         session.close()
 
 
 # ==================== 播放历史与推荐 ====================
 
+_preference_insert = sqlite_insert(UserPreference)
+# 累加偏好播放次数的语句，以参数列表批量执行（executemany）
+_PREFERENCE_UPSERT = _preference_insert.on_conflict_do_update(
+    index_elements=['category', 'value'],
+    set_={
+        'play_count': UserPreference.play_count + 1,
+        'last_played': _preference_insert.excluded.last_played,
+    }
+)
+
+
+def _record_play(session, music_id, completion_rate):
+    """
+    在给定会话中记录一次播放并更新用户偏好（不提交）
+
+    Args:
+        session: 数据库会话
+        music_id: 音乐的数据库 ID
+        completion_rate: 播放完成率 (0.0 ~ 1.0)
+    """
+    # 1. 添加播放历史记录
+    history = PlayHistory(music_id=music_id, completion_rate=completion_rate)
+    session.add(history)
+
+    # 2. 获取音乐元数据（主键查找，对象已在会话中时不再查询数据库）
+    music = session.get(Music, music_id)
+    if not music:
+        return
+
+    # 3. 更新用户偏好
+    # 预先构造的 INSERT ... ON CONFLICT 对每个维度执行一次：不存在则新建，存在则累加播放次数
+    now = datetime.now(timezone.utc)
+
+    # 年代处理（将具体年份转换为年代，如 1985 -> 1980）
+    decade = str((music.year // 10) * 10) if music.year else None
+
+    rows = [
+        {'category': category, 'value': value, 'play_count': 1, 'last_played': now}
+        for category, value in (('artist', music.artist), ('album', music.album),
+                                ('genre', music.genre), ('decade', decade))
+        if value
+    ]
+    if rows:
+        session.execute(_PREFERENCE_UPSERT, rows)
+
+
 def record_play(music_id, completion_rate=1.0):
     """
     记录播放历史并更新用户偏好
@@ -253,48 +676,156 @@ def record_play(music_id, completion_rate=1.0):
     """
     session = get_session()
     try:
-        # 1. 添加播放历史记录
-        history = PlayHistory(music_id=music_id, completion_rate=completion_rate)
-        session.add(history)
-
-        # 2. 获取音乐元数据
-        music = session.query(Music).filter_by(id=music_id).first()
-        if not music:
-            session.commit()
-            return
-
-        # 3. 更新用户偏好
-        # 定义更新偏好的辅助函数
-        def update_preference(category, value):
-            """更新单个类别的用户偏好"""
-            if not value:
-                return
-
-            # 查找现有偏好记录
-            pref = session.query(UserPreference).filter_by(**{category: value}).first()
-
-            if pref:
-                # 已有记录，累加播放次数
-                pref.play_count += 1
-                pref.last_played = datetime.now(timezone.utc)
-            else:
-                # 新建偏好记录
-                pref = UserPreference(**{category: value}, play_count=1)
-                session.add(pref)
-
-        # 更新四个维度的偏好
-        update_preference('artist', music.artist)
-        update_preference('album', music.album)
-        update_preference('genre', music.genre)
-
-        # 年代处理（将具体年份转换为年代，如 1985 -> 1980）
-        if music.year:
-            decade = (music.year // 10) * 10
-            update_preference('decade', decade)
-
+        _record_play(session, music_id, completion_rate)
         session.commit()
     finally:
         session.close()
+    _invalidate_preferences()
+
+
+# 待写入的播放记录：(music_id, completion_rate)
+_play_queue = queue.Queue()
+_play_writer = None
+_play_writer_lock = threading.Lock()
+
+
+def queue_plays(music_ids, completion_rate=1.0):
+    """
+    将播放记录放入后台写入队列，立即返回
+
+    后台线程把一段时间内的播放合并到同一个事务中提交（见 _drain_plays），
+    适合播放工具等不需要等待写入结果的场景；进程退出前会写完队列中的记录
+
+    Args:
+        music_ids: 音乐的数据库 ID 列表
+        completion_rate: 播放完成率 (0.0 ~ 1.0)，默认为 1.0（完整播放）
+    """
+    global _play_writer
+    for music_id in music_ids:
+        _play_queue.put((music_id, completion_rate))
+
+    if _play_writer is None:
+        with _play_writer_lock:
+            if _play_writer is None:
+                _play_writer = threading.Thread(
+                    target=_drain_plays, name="play-writer", daemon=True
+                )
+                _play_writer.start()
+                atexit.register(flush_plays)
+
+
+def flush_plays():
+    """等待写入队列中的播放记录全部提交"""
+    _play_queue.join()
+
+
+def _drain_plays():
+    """
+    后台写入线程：取出队列中的播放记录，分批写入数据库
+
+    取到第一条记录后最多再等待 _PLAY_BATCH_WINDOW 秒凑批，
+    每批只提交一次事务
+    """
+    while True:
+        batch = [_play_queue.get()]
+        deadline = time.monotonic() + _PLAY_BATCH_WINDOW
+        while len(batch) < _PLAY_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_play_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        session = get_session()
+        try:
+            for music_id, completion_rate in batch:
+                _record_play(session, music_id, completion_rate)
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception("Error recording plays")
+        finally:
+            session.close()
+            _invalidate_preferences()
+            for _ in batch:
+                _play_queue.task_done()
+
+
+# 偏好数据版本号：每次记录播放后递增，使缓存的偏好统计失效
+_prefs_version = 0
+# 缓存的偏好统计：(计算时的版本号, 结果)，None 表示尚未计算
+_prefs_cache = None
+_prefs_lock = threading.Lock()
+
+
+def _invalidate_preferences():
+    """偏好数据发生变化（记录播放）后调用，使 get_user_preferences 的缓存失效"""
+    global _prefs_version
+    with _prefs_lock:
+        _prefs_version += 1
+
+
+# 偏好统计的维度：(返回字段名, 偏好维度, 取前几名)
+_PREFERENCE_TOPS = (
+    ('top_artists', 'artist', 5),
+    ('top_decades', 'decade', 3),
+    ('top_genres', 'genre', 3),
+)
+
+
+def _top_preferences(category, limit):
+    """
+    构造"播放次数最多的偏好值"查询
+
+    走 (category, play_count) 索引，按维度做一次范围扫描
+
+    Args:
+        category: 偏好维度（artist, decade, genre）
+        limit: 取前几名
+
+    Returns:
+        Select: 返回 (value, total) 的查询，按播放次数降序
+    """
+    return select(
+        UserPreference.value.label('value'), UserPreference.play_count.label('total')
+    ).where(
+        UserPreference.category == category
+    ).order_by(
+        UserPreference.play_count.desc()
+    ).limit(limit)
+
+
+def _ranked_preferences_statement():
+    """
+    构造一次取出所有维度前几名偏好值的查询
+
+    ROW_NUMBER() 窗口函数按维度分区、按播放次数降序编号，
+    每个维度只保留编号不超过其名额的记录
+
+    Returns:
+        Select: 返回 (category, value) 的查询，按维度、名次排序
+    """
+    ranked = select(
+        UserPreference.category,
+        UserPreference.value,
+        func.row_number().over(
+            partition_by=UserPreference.category,
+            order_by=UserPreference.play_count.desc()
+        ).label('rn')
+    ).where(
+        UserPreference.category.in_([category for _, category, _ in _PREFERENCE_TOPS])
+    ).subquery()
+
+    quota = case({category: limit for _, category, limit in _PREFERENCE_TOPS},
+                 value=ranked.c.category)
+    return select(ranked.c.category, ranked.c.value).where(
+        ranked.c.rn <= quota
+    ).order_by(ranked.c.category, ranked.c.rn)
+
+
+_TOP_PREFERENCES = _ranked_preferences_statement()
 
 
 def get_user_preferences():
@@ -306,129 +837,129 @@ def get_user_preferences():
     - 年代（Top 3）
     - 风格（Top 3）
 
+    三个维度的统计由窗口函数合并为一次查询
+    结果会被缓存，直到下一次记录播放（见 record_play）
+    返回的字典为共享对象，调用方不应修改
+
     Returns:
         dict: 包含 top_artists, top_decades, top_genres 的字典
     """
+    global _prefs_cache
+
+    # 先读取版本号：查询期间有新的播放记录时，缓存的版本号较旧，下次会重新计算
+    version = _prefs_version
+    cached = _prefs_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
     session = get_session()
     try:
-        # 查询播放次数最多的艺术家
-        top_artists = session.query(
-            UserPreference.artist,
-            func.sum(UserPreference.play_count).label('total')
-        ).filter(
-            UserPreference.artist.isnot(None)
-        ).group_by(
-            UserPreference.artist
-        ).order_by(
-            func.sum(UserPreference.play_count).desc()
-        ).limit(5).all()
-
-        # 查询播放次数最多的年代
-        top_decades = session.query(
-            UserPreference.decade,
-            func.sum(UserPreference.play_count).label('total')
-        ).filter(
-            UserPreference.decade.isnot(None)
-        ).group_by(
-            UserPreference.decade
-        ).order_by(
-            func.sum(UserPreference.play_count).desc()
-        ).limit(3).all()
-
-        # 查询播放次数最多的风格
-        top_genres = session.query(
-            UserPreference.genre,
-            func.sum(UserPreference.play_count).label('total')
-        ).filter(
-            UserPreference.genre.isnot(None)
-        ).group_by(
-            UserPreference.genre
-        ).order_by(
-            func.sum(UserPreference.play_count).desc()
-        ).limit(3).all()
-
-        # 构建返回结果
-        return {
-            'top_artists': [a[0] for a in top_artists if a[0]],
-            'top_decades': [d[0] for d in top_decades if d[0]],
-            'top_genres': [g[0] for g in top_genres if g[0]]
-        }
+        # 结果已按维度、名次排序，直接分组
+        keys = {category: key for key, category, _ in _PREFERENCE_TOPS}
+        result = {key: [] for key in keys.values()}
+        for category, value in session.execute(_TOP_PREFERENCES):
+            result[keys[category]].append(value)
+        # 年代以字符串存储，返回时还原为整数
+        result['top_decades'] = [int(value) for value in result['top_decades']]
     finally:
         session.close()
 
+    with _prefs_lock:
+        _prefs_cache = (version, result)
+    return result
+
 
-def get_recommended_tracks(limit=10):
+@lru_cache(maxsize=2)
+def _recommend_statement(with_prefs):
+    """
+    构造推荐打分语句（只构造一次）
+
+    Args:
+        with_prefs: True 时偏好值由参数 top_artists/top_decades/top_genres 传入（IN 列表），
+                    False 时在 SQL 中用子查询统计
+
+    Returns:
+        Select: 只查询命中至少一项偏好的歌曲，按分数降序、同分随机排序，数量由参数 limit 指定
+    """
+    # 年代：将具体年份转换为年代，如 1985 -> 1980
+    decade = Music.year - Music.year % 10
+
+    if with_prefs:
+        # expanding 参数在执行时展开为 IN 列表，列表长度不影响语句缓存
+        top_artists = bindparam('top_artists', expanding=True)
+        top_decades = bindparam('top_decades', expanding=True)
+        top_genres = bindparam('top_genres', expanding=True)
+    else:
+        # 偏好值子查询，用于 IN 条件
+        def top_values(category, limit, type_=None):
+            value = _top_preferences(category, limit).subquery().c.value
+            return select(cast(value, type_) if type_ is not None else value)
+
+        top_artists = top_values('artist', 3)
+        top_decades = top_values('decade', 2, Integer)
+        top_genres = top_values('genre', 2)
+
+    artist_match = Music.artist.in_(top_artists)
+    decade_match = decade.in_(top_decades)
+    genre_match = Music.genre.in_(top_genres)
+    score = (
+        case((artist_match, 3), else_=0)
+        + case((decade_match, 2), else_=0)
+        + case((genre_match, 1), else_=0)
+    )
+
+    # 只取播放所需的列，不构造 ORM 对象
+    # 先过滤出命中偏好的歌曲，RANDOM() 排序只作用于这部分候选，而不是整个音乐库
+    return select(*_PLAYLIST_COLUMNS).where(
+        or_(artist_match, decade_match, genre_match)
+    ).order_by(
+        score.desc(), func.random()
+    ).limit(bindparam('limit'))
+
+
+def get_recommended_tracks(limit=10, prefs=None):
     """
     根据用户偏好推荐音乐
 
-    推荐算法优先级：
-    1. 用户最常听的歌手
-    2. 用户最常听的年代
-    3. 用户最常听的风格
-    4. 如果推荐不足，随机填充
+    推荐算法按匹配程度打分（可叠加）：
+    1. 用户最常听的歌手（前 3 名）: 3 分
+    2. 用户最常听的年代（前 2 名）: 2 分
+    3. 用户最常听的风格（前 2 名）: 1 分
+    4. 分数相同的随机排序
+    5. 命中偏好的歌曲不足 limit 首时，用随机抽样的歌曲补足（没有偏好记录时即为随机推荐）
+
+    偏好统计和打分在同一条 SQL 中完成，只对命中偏好的歌曲排序；
+    调用方已经查询过偏好时可以传入 prefs，直接用作 IN 列表，不再重复统计
 
     Args:
         limit: 返回的推荐数量，默认 10 首
+        prefs: 可选，get_user_preferences() 的返回值
 
     Returns:
-        List[Music]: 推荐的音乐列表
+        List[Row]: 推荐的音乐记录列表（id, file_path, title, artist, album, year, duration）
     """
     session = get_session()
     try:
-        # 获取用户偏好
-        prefs = get_user_preferences()
-
-        # 如果没有偏好记录，返回随机音乐
-        if not prefs['top_artists'] and not prefs['top_decades']:
-            return session.query(Music).order_by(func.random()).limit(limit).all()
-
-        # 构建推荐列表
-        results = []
-        seen_ids = set()  # 用于去重
-
-        # 优先级 1: 用户喜欢的歌手
-        for artist in prefs['top_artists'][:3]:
-            tracks = session.query(Music).filter(
-                Music.artist.ilike(f"%{artist}%")
-            ).limit(5).all()
-            for t in tracks:
-                if t.id not in seen_ids:
-                    results.append(t)
-                    seen_ids.add(t.id)
-
-        # 优先级 2: 用户喜欢的年代
-        for decade in prefs['top_decades'][:2]:
-            if decade:
-                tracks = session.query(Music).filter(
-                    Music.year >= decade,
-                    Music.year < decade + 10
-                ).limit(5).all()
-                for t in tracks:
-                    if t.id not in seen_ids:
-                        results.append(t)
-                        seen_ids.add(t.id)
-
-        # 优先级 3: 用户喜欢的风格
-        for genre in prefs['top_genres'][:2]:
-            if genre:
-                tracks = session.query(Music).filter(
-                    Music.genre.ilike(f"%{genre}%")
-                ).limit(5).all()
-                for t in tracks:
-                    if t.id not in seen_ids:
-                        results.append(t)
-                        seen_ids.add(t.id)
-
-        # 如果推荐数量不足，随机填充
-        if len(results) < limit:
-            remaining = limit - len(results)
-            random_tracks = session.query(Music).order_by(
-                func.random()
-            ).limit(remaining).all()
-            for t in random_tracks:
-                if t.id not in seen_ids:
-                    results.append(t)
-
-        return results[:limit]
+        if prefs is None:
+            params = {'limit': limit}
+        else:
+            # 没有任何偏好时即为随机推荐
+            if not any(prefs.values()):
+                return _sample_music(session, limit)
+
+            params = {
+                'top_artists': prefs['top_artists'][:3],
+                'top_decades': prefs['top_decades'][:2],
+                'top_genres': prefs['top_genres'][:2],
+                'limit': limit,
+            }
+
+        tracks = session.execute(_recommend_statement(prefs is not None), params).all()
+        if len(tracks) < limit:
+            # 按 ID 随机抽样补足，避免对全表 ORDER BY RANDOM()
+            seen = {track.id for track in tracks}
+            extra = [track for track in _sample_music(session, limit + len(tracks)) if track.id not in seen]
+            tracks.extend(extra[:limit - len(tracks)])
+        return tracks
     finally:
         session.close()
@@ -8,14 +8,22 @@
 作者: AI Assistant
 """
 
+import logging
 from datetime import datetime, timezone
 
 # SQLAlchemy 核心组件
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import (
+    create_engine, event, inspect, text,
+    Column, Integer, String, DateTime, Float, Index, UniqueConstraint
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
 
 import config
 
+# 模块日志：init_db 在 MCP 服务器启动前调用，stdout 是协议通道，提示信息写入日志（stderr）
+logger = logging.getLogger(__name__)
+
 # 创建 ORM 基类
 # 所有数据库模型类都需要继承此基类
 Base = declarative_base()
@@ -36,11 +44,13 @@ class Music(Base):
     file_path = Column(String(500), unique=True, nullable=False)
 
     # 音乐元数据
-    title = Column(String(255), nullable=True)      # 歌曲标题
-    artist = Column(String(255), nullable=True)      # 艺术家/歌手
-    album = Column(String(255), nullable=True)       # 专辑名称
-    year = Column(Integer, nullable=True)            # 发行年份
-    genre = Column(String(100), nullable=True)       # 音乐风格/类型
+    # artist/album/genre/year 建有索引，用于精确匹配（推荐）、去重列表和年代区间查询
+    # 模糊搜索由 music_fts 全文索引负责
+    title = Column(String(255), nullable=True)                # 歌曲标题
+    artist = Column(String(255), nullable=True, index=True)   # 艺术家/歌手
+    album = Column(String(255), nullable=True, index=True)    # 专辑名称
+    year = Column(Integer, nullable=True, index=True)         # 发行年份
+    genre = Column(String(100), nullable=True, index=True)    # 音乐风格/类型
 
     # 播放时长（单位：秒）
     duration = Column(Integer, nullable=True)
@@ -49,6 +59,9 @@ class Music(Base):
     # 注意：保留 format 字段名以兼容现有数据库
     format = Column(String(10), nullable=True)
 
+    # 文件修改时间（os.stat 的 st_mtime），重新扫描时跳过未修改的文件
+    mtime = Column(Float, nullable=True)
+
     # 记录创建时间
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
@@ -70,7 +83,7 @@ class PlayHistory(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
 
     # 关联的音乐ID（外键）
-    music_id = Column(Integer, nullable=False)
+    music_id = Column(Integer, nullable=False, index=True)
 
     # 播放时间
     played_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -88,18 +101,18 @@ class UserPreference(Base):
     用户音乐偏好表
 
     记录用户对不同歌手、专辑、风格、年代的偏好程度
-    用于智能推荐算法
+    每条记录为一个 (维度, 值) 组合，用于智能推荐算法
     """
     __tablename__ = "user_preference"
 
     # 主键自增ID
     id = Column(Integer, primary_key=True, autoincrement=True)
 
-    # 偏好维度（不同类型记录的偏好）
-    artist = Column(String(255), nullable=True)      # 偏好的歌手
-    album = Column(String(255), nullable=True)       # 偏好的专辑
-    genre = Column(String(100), nullable=True)       # 偏好的风格
-    decade = Column(Integer, nullable=True)          # 偏好的年代（如 1980, 1990）
+    # 偏好维度：artist / album / genre / decade
+    category = Column(String(16), nullable=False)
+
+    # 偏好的值（歌手名、专辑名、风格名；年代存为字符串，如 "1980"）
+    value = Column(String(255), nullable=False)
 
     # 播放次数（累加）
     play_count = Column(Integer, default=0)
@@ -107,22 +120,128 @@ class UserPreference(Base):
     # 最后播放时间
     last_played = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        # 同一维度的同一值只有一条记录，供 INSERT ... ON CONFLICT 累加播放次数
+        UniqueConstraint('category', 'value', name='uq_pref_category_value'),
+        # 按维度取播放次数最多的偏好值：索引已按播放次数降序排列，
+        # 取前几名只需读取索引开头的几条，窗口函数也无需额外排序
+        Index('ix_pref_category_count', category, play_count.desc()),
+    )
+
     def __repr__(self):
-        return f"<UserPreference(artist='{self.artist}', genre='{self.genre}', play_count={self.play_count})>"
+        return f"<UserPreference(category='{self.category}', value='{self.value}', play_count={self.play_count})>"
 
 
 # ==================== 数据库连接初始化 ====================
 
 # 创建数据库引擎
 # 使用 SQLite 数据库，路径从配置中读取
+# 文件数据库默认使用 QueuePool：会话关闭后连接归还连接池，下次直接复用
 engine = create_engine(
-    f"sqlite:///{config.DATABASE_PATH}",
+    f"sqlite:///{config.DATABASE_PATH_STR}",
     echo=False  # 调试时可设为 True 查看 SQL 语句
 )
 
+
+@event.listens_for(engine, "connect")
+def _configure_connection(dbapi_conn, connection_record):
+    """
+    新建 SQLite 连接时设置 PRAGMA
+
+    连接由连接池复用，这些设置每个连接只执行一次：
+    - journal_mode=WAL: 读写互不阻塞（后台写入播放记录时查询不受影响）
+    - synchronous=NORMAL: WAL 模式下每次提交不再 fsync
+    - cache_size: 页缓存 64MB（负数表示以 KB 为单位）
+    - mmap_size: 通过内存映射读取数据库文件
+    - temp_store=MEMORY: 临时表和排序使用内存
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 # 创建会话工厂
-# 每次数据库操作都需要创建新会话
-SessionLocal = sessionmaker(bind=engine)
+# scoped_session 为每个线程维护一个会话并重复使用，close() 后连接归还连接池，
+# 会话对象本身留给该线程的下一次数据库操作
+# expire_on_commit=False: 提交后不使对象过期，返回给调用方的对象无需重新加载
+SessionLocal = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+
+
+# ==================== 全文索引 ====================
+
+# 歌曲标题/艺术家/专辑的 FTS5 全文索引（外部内容表，数据来自 music 表）
+# 使用 trigram 分词器，支持任意子串匹配（包括中文），与 LIKE '%xx%' 语义一致
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS music_fts USING fts5(
+        title, artist, album,
+        content='music', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    # 触发器：music 表变更时同步全文索引
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_ai AFTER INSERT ON music BEGIN
+        INSERT INTO music_fts(rowid, title, artist, album)
+        VALUES (new.id, new.title, new.artist, new.album);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_ad AFTER DELETE ON music BEGIN
+        INSERT INTO music_fts(music_fts, rowid, title, artist, album)
+        VALUES ('delete', old.id, old.title, old.artist, old.album);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS music_fts_au AFTER UPDATE ON music BEGIN
+        INSERT INTO music_fts(music_fts, rowid, title, artist, album)
+        VALUES ('delete', old.id, old.title, old.artist, old.album);
+        INSERT INTO music_fts(rowid, title, artist, album)
+        VALUES (new.id, new.title, new.artist, new.album);
+    END
+    """,
+]
+
+# 全文索引是否可用（由 init_db 检测）
+_fts_enabled = False
+
+
+def _init_fts():
+    """
+    创建全文索引表及同步触发器
+
+    首次创建时从 music 表重建索引
+    SQLite 未编译 FTS5 或版本过低（不支持 trigram）时返回 False
+
+    Returns:
+        bool: 全文索引是否可用
+    """
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'music_fts'"
+            )).first() is not None
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                conn.execute(text("INSERT INTO music_fts(music_fts) VALUES ('rebuild')"))
+        return True
+    except OperationalError as e:
+        logger.warning("全文索引不可用，使用 LIKE 查询: %s", e)
+        return False
+
+
+def fts_enabled():
+    """
+    全文索引是否可用
+
+    Returns:
+        bool: init_db 成功创建全文索引后为 True
+    """
+    return _fts_enabled
 
 
 def init_db():
@@ -132,13 +251,101 @@ def init_db():
     创建所有表结构（如果不存在）
     必须在应用启动时调用一次
     """
+    global _fts_enabled
+
+    rebuild_preferences = _drop_legacy_user_preference()
+
     Base.metadata.create_all(engine)
+    _add_missing_columns()
+
+    if rebuild_preferences:
+        _rebuild_user_preference()
+
+    # create_all 不会为已存在的表补建索引，旧数据库需要单独创建
+    # ix_pref_cat_count 为升序索引，已由 ix_pref_category_count 取代
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_pref_cat_count"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+    _fts_enabled = _init_fts()
+
+
+def _add_missing_columns():
+    """
+    为已存在的表补充模型中新增的列
+
+    create_all 不会修改已存在的表；新增的列都允许为空，
+    可以直接 ALTER TABLE ... ADD COLUMN
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    col_type = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+
+
+def _drop_legacy_user_preference():
+    """
+    删除旧版（每个维度一列）的用户偏好表
+
+    旧表无法升级为 (category, value) 结构，删除后由 init_db 重新建表，
+    再从播放历史恢复数据
+
+    Returns:
+        bool: 是否删除了旧表
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(UserPreference.__tablename__):
+        return False
+    columns = {c['name'] for c in inspector.get_columns(UserPreference.__tablename__)}
+    if 'category' in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {UserPreference.__tablename__}"))
+    return True
+
+
+# 从播放历史统计各维度的偏好，与 record_play 的累加规则一致
+_REBUILD_PREFERENCE_SQL = """
+INSERT INTO user_preference (category, value, play_count, last_played)
+SELECT category, value, COUNT(*), MAX(played_at) FROM (
+    SELECT 'artist' AS category, m.artist AS value, h.played_at
+    FROM play_history h JOIN music m ON m.id = h.music_id
+    WHERE m.artist IS NOT NULL AND m.artist != ''
+    UNION ALL
+    SELECT 'album', m.album, h.played_at
+    FROM play_history h JOIN music m ON m.id = h.music_id
+    WHERE m.album IS NOT NULL AND m.album != ''
+    UNION ALL
+    SELECT 'genre', m.genre, h.played_at
+    FROM play_history h JOIN music m ON m.id = h.music_id
+    WHERE m.genre IS NOT NULL AND m.genre != ''
+    UNION ALL
+    SELECT 'decade', CAST(m.year - m.year % 10 AS TEXT), h.played_at
+    FROM play_history h JOIN music m ON m.id = h.music_id
+    WHERE m.year IS NOT NULL AND m.year != 0
+)
+GROUP BY category, value
+"""
+
+
+def _rebuild_user_preference():
+    """从播放历史重新生成用户偏好表"""
+    with engine.begin() as conn:
+        conn.execute(text(_REBUILD_PREFERENCE_SQL))
 
 
 def get_session():
     """
     获取数据库会话
 
+    返回当前线程的会话；同一线程内不要嵌套使用（内层 close 会影响外层）
+
     使用示例:
         session = get_session()
         try:
@@ -151,3 +358,16 @@ def get_session():
         Session: SQLAlchemy 会话对象
     """
     return SessionLocal()
+
+
+def new_session():
+    """
+    创建独立的数据库会话
+
+    不与当前线程的会话共享，适合逐批读取结果的长时间遍历：
+    遍历期间调用其他数据库函数不会关闭它
+
+    Returns:
+        Session: 新的 SQLAlchemy 会话对象，用完需要 close()
+    """
+    return SessionLocal.session_factory()
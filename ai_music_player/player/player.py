@@ -19,12 +19,9 @@
 """
 
 import random
+from array import array
 from pathlib import Path
 
-# pygame: Python 游戏开发库
-# 此处使用其 mixer 模块进行音频播放
-import pygame
-
 import config
 import database.db as db
 
@@ -44,22 +41,42 @@ class MusicPlayer:
         volume: 当前音量 (0.0 ~ 1.0)
     """
 
+    # 固定属性集合：实例不创建 __dict__，状态查询时属性访问更快、占用内存更少
+    __slots__ = (
+        '_music', 'current_track', '_current_music', 'playlist', '_order', 'current_index',
+        'is_playing', 'is_paused', '_volume_percent',
+    )
+
     def __init__(self):
         """
         初始化音乐播放器
 
         初始化 pygame mixer，设置默认音量
         """
+        # pygame: Python 游戏开发库，此处使用其 mixer 模块进行音频播放
+        # 在创建播放器时才导入：只导入本模块（如数据库相关代码、测试收集）不会加载 SDL
+        import pygame
+
         # 初始化 pygame 音频混合器
         # 必须在使用任何 mixer 功能前调用
         pygame.mixer.init()
 
+        # pygame.mixer.music 模块，各播放控制方法通过它操作，省去逐级属性查找
+        self._music = pygame.mixer.music
+
         # 当前播放的曲目（文件路径）
         self.current_track = None
 
+        # 当前曲目的 Music 对象（播放列表中已有，或首次查询后缓存）
+        self._current_music = None
+
         # 播放列表（Music 对象列表）
         self.playlist = []
 
+        # 随机播放顺序：播放列表下标组成的整数数组，None 表示按列表顺序播放
+        # 随机播放时只打乱下标，播放列表本身保持不变
+        self._order = None
+
         # 当前播放的曲目在播放列表中的索引
         self.current_index = 0
 
@@ -72,7 +89,7 @@ class MusicPlayer:
         self.volume = config.DEFAULT_VOLUME
 
         # 设置初始音量
-        pygame.mixer.music.set_volume(self.volume)
+        self._music.set_volume(self.volume)
 
     def load(self, file_path):
         """
@@ -85,8 +102,10 @@ class MusicPlayer:
             bool: 加载是否成功
         """
         try:
-            pygame.mixer.music.load(file_path)
+            self._music.load(file_path)
             self.current_track = file_path
+            # 换了曲目，之前缓存的曲目信息失效
+            self._current_music = None
             return True
         except Exception as e:
             print(f"Error loading {file_path}: {e}")
@@ -100,7 +119,7 @@ class MusicPlayer:
             bool: 播放是否成功启动
         """
         try:
-            pygame.mixer.music.play()
+            self._music.play()
             self.is_playing = True
             self.is_paused = False
             return True
@@ -118,7 +137,7 @@ class MusicPlayer:
             bool: 暂停是否成功
         """
         try:
-            pygame.mixer.music.pause()
+            self._music.pause()
             self.is_paused = True
             return True
         except Exception as e:
@@ -133,7 +152,7 @@ class MusicPlayer:
             bool: 恢复播放是否成功
         """
         try:
-            pygame.mixer.music.unpause()
+            self._music.unpause()
             self.is_paused = False
             return True
         except Exception as e:
@@ -150,7 +169,7 @@ class MusicPlayer:
             bool: 停止是否成功
         """
         try:
-            pygame.mixer.music.stop()
+            self._music.stop()
             self.is_playing = False
             self.is_paused = False
             return True
@@ -200,11 +219,15 @@ class MusicPlayer:
         if not self.playlist:
             return False
 
-        # 获取当前曲目
-        track = self.playlist[self.current_index]
+        # 获取当前曲目（随机播放时先通过顺序数组换算下标）
+        index = self.current_index
+        if self._order is not None:
+            index = self._order[index]
+        track = self.playlist[index]
 
         # 加载并播放
         if self.load(track.file_path):
+            self._current_music = track
             return self.play()
         return False
 
@@ -217,6 +240,7 @@ class MusicPlayer:
         """
         # 转换为列表以支持多种输入类型
         self.playlist = list(tracks)
+        self._order = None
         # 重置播放索引到开头
         self.current_index = 0
 
@@ -234,6 +258,7 @@ class MusicPlayer:
         """
         self.current_track = track.file_path
         if self.load(track.file_path):
+            self._current_music = track
             return self.play()
         return False
 
@@ -249,7 +274,8 @@ class MusicPlayer:
         if not self.playlist:
             return False
 
-        # 从第一首开始
+        # 从第一首开始，按列表顺序
+        self._order = None
         self.current_index = 0
         return self.play_current()
 
@@ -257,7 +283,8 @@ class MusicPlayer:
         """
         随机播放播放列表
 
-        随机打乱播放列表后从第一首开始播放
+        随机打乱播放顺序后从第一首开始播放
+        只打乱下标数组，播放列表中的 Music 对象不移动
 
         Returns:
             bool: 播放是否成功
@@ -265,11 +292,46 @@ class MusicPlayer:
         if not self.playlist:
             return False
 
-        # 随机打乱列表顺序
-        random.shuffle(self.playlist)
+        # 随机打乱播放顺序
+        self._order = array('i', range(len(self.playlist)))
+        random.shuffle(self._order)
         self.current_index = 0
         return self.play_current()
 
+    @property
+    def volume(self):
+        """
+        当前音量 (0.0 ~ 1.0)
+
+        内部以整数百分比保存，反复增减音量不会累积浮点误差（如 0.7 + 0.1 得到 0.7999...）
+        """
+        return self._volume_percent / 100
+
+    @volume.setter
+    def volume(self, value):
+        # 确保音量在有效范围内 (0 ~ 100)
+        self._volume_percent = max(0, min(100, round(value * 100)))
+
+    @property
+    def volume_percent(self):
+        """当前音量百分比 (0 ~ 100)，对外展示时直接使用，不再由浮点数换算"""
+        return self._volume_percent
+
+    def _apply_volume_percent(self, percent):
+        """
+        按百分比设置音量并应用到 mixer
+
+        Args:
+            percent: 音量百分比（会被限制在 0 ~ 100）
+
+        Returns:
+            float: 实际设置的音量值 (0.0 ~ 1.0)
+        """
+        self._volume_percent = max(0, min(100, percent))
+        volume = self.volume
+        self._music.set_volume(volume)
+        return volume
+
     def set_volume(self, volume):
         """
         设置音量
@@ -278,12 +340,9 @@ class MusicPlayer:
             volume: 音量值 (0.0 ~ 1.0)
 
         Returns:
-            float: 实际设置的音量值（会被限制在有效范围内）
+            float: 实际设置的音量值（会被限制在有效范围内，精确到 1%）
         """
-        # 确保音量在有效范围内 (0.0 ~ 1.0)
-        self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
-        return self.volume
+        return self._apply_volume_percent(round(volume * 100))
 
     def volume_up(self):
         """
@@ -292,7 +351,7 @@ class MusicPlayer:
         Returns:
             float: 增大后的音量值
         """
-        return self.set_volume(self.volume + 0.1)
+        return self._apply_volume_percent(self._volume_percent + 10)
 
     def volume_down(self):
         """
@@ -301,7 +360,7 @@ class MusicPlayer:
         Returns:
             float: 降低后的音量值
         """
-        return self.set_volume(self.volume - 0.1)
+        return self._apply_volume_percent(self._volume_percent - 10)
 
     def get_status(self):
         """
@@ -323,7 +382,8 @@ class MusicPlayer:
         """
         获取当前曲目的详细信息
 
-        从数据库查询当前曲目的元数据
+        通过播放列表或 play_track 播放时直接返回对应的 Music 对象；
+        否则从数据库查询一次并缓存，直到加载下一首曲目
 
         Returns:
             Music 或 None: 当前曲目的数据库记录
@@ -331,9 +391,12 @@ class MusicPlayer:
         if not self.current_track:
             return None
 
-        # 从文件路径中提取文件名（不含扩展名）作为查询依据
-        # 注意：这种查询方式可能不够精确，建议使用播放列表中的曲目信息
-        return db.get_music_by_title(Path(self.current_track).stem)
+        if self._current_music is None:
+            # 从文件路径中提取文件名（不含扩展名）作为查询依据
+            # 注意：这种查询方式可能不够精确，仅在没有曲目对象时使用
+            matches = db.get_music_by_title(Path(self.current_track).stem)
+            self._current_music = matches[0] if matches else None
+        return self._current_music
 
     def is_busy(self):
         """
@@ -344,4 +407,4 @@ class MusicPlayer:
         Returns:
             bool: 是否有音频正在播放
         """
-        return pygame.mixer.music.get_busy() > 0
+        return bool(self._music.get_busy())
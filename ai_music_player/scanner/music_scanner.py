@@ -14,6 +14,7 @@
 
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # mutagen: Python 音频元数据读取库
@@ -23,8 +24,31 @@ from mutagen import File
 import config
 import database.db as db
 
-# 从配置文件读取支持的音频格式
-SUPPORTED_EXTENSIONS = config.SUPPORTED_FORMATS
+# 从配置文件读取支持的音频格式（frozenset，扫描时 O(1) 判断）
+# 统一转为小写，与扫描时小写化的文件扩展名比较
+SUPPORTED_EXTENSIONS = frozenset(ext.lower() for ext in config.SUPPORTED_FORMATS)
+
+# 文件数不少于此值时才用多进程提取元数据，文件较少时启动进程池得不偿失
+_PARALLEL_MIN_FILES = 64
+
+# 提取元数据的最大进程数（限制上限，避免大量进程占满内存）
+_MAX_WORKERS = min(os.cpu_count() or 1, 8)
+
+# 每次分派给子进程的文件数，减少进程间通信次数
+_CHUNK_SIZE = 32
+
+# 累积多少条记录写入一次数据库（每次写入一个事务）
+_FLUSH_SIZE = 500
+
+# 各字段的候选标签键名（按优先级）：ID3v2 标准键名、Vorbis/通用键名、MP4 键名
+_TITLE_KEYS = ('TIT2', 'title', '\xa9nam')
+_ARTIST_KEYS = ('TPE1', 'TPE2', 'artist', '\xa9ART')
+_ALBUM_KEYS = ('TALB', 'album', '\xa9alb')
+_GENRE_KEYS = ('TCON', 'genre', '\xa9gen')
+
+# 年份标签的候选键名（按优先级）及提取 4 位数年份的正则（模块加载时编译一次）
+_YEAR_KEYS = ('TDRC', 'TYER', 'date', 'year')
+_YEAR_RE = re.compile(r'\d{4}')
 
 
 # ==================== 辅助函数 ====================
@@ -61,18 +85,30 @@ def get_id3_tag(audio, *keys):
         str or None: 标签值，如果都不存在则返回 None
     """
     # 确保 audio 有 tags 属性
-    if not hasattr(audio, 'tags') or audio.tags is None:
+    tags = getattr(audio, 'tags', None)
+    if tags is None:
         return None
+    return _pick_tag(tags, keys)
+
 
-    tags = audio.tags
+def _pick_tag(tags, keys):
+    """
+    按顺序在标签中查找第一个非空值
+
+    Args:
+        tags: 音频文件的标签对象（不为 None）
+        keys: 备选标签键名元组
+
+    Returns:
+        str or None: 标签值，如果都不存在则返回 None
+    """
     for key in keys:
-        if key in tags and tags[key]:
-            value = tags[key]
+        value = tags.get(key)
+        if value:
             # 处理列表类型的值（如多个艺术家）
-            if isinstance(value, list) and value:
+            if isinstance(value, list):
                 return str(value[0])
-            elif value:
-                return str(value)
+            return str(value)
     return None
 
 
@@ -101,59 +137,63 @@ def extract_metadata(file_path):
         - format: 音频格式
     """
     try:
-        # 使用 mutagen 读取音频文件
-        audio = File(file_path)
-        if audio is None:
-            return None
-
-        # 提取标题 (TIT2 是 ID3v2 标准键名)
-        title = get_id3_tag(audio, 'TIT2', 'title', '\xa9nam')
-
-        # 提取艺术家 (TPE1 是 ID3v2 标准键名)
-        artist = get_id3_tag(audio, 'TPE1', 'TPE2', 'artist', '\xa9ART')
-
-        # 提取专辑 (TALB 是 ID3v2 标准键名)
-        album = get_id3_tag(audio, 'TALB', 'album', '\xa9alb')
-
-        # 提取风格 (TCON 是 ID3v2 标准键名)
-        genre = get_id3_tag(audio, 'TCON', 'genre', '\xa9gen')
-
-        # 提取年份
-        # 尝试多种 ID3 年份标签格式
-        year = None
-        for key in ['TDRC', 'TYER', 'date', 'year']:
-            # 先检查 audio 是否有 tags 属性
-            if not hasattr(audio, 'tags') or audio.tags is None:
-                continue
-            if key in audio.tags:
-                value = get_id3_tag(audio, key)
-                if value:
-                    # 使用正则表达式提取 4 位数年份
-                    match = re.search(r'(\d{4})', value)
-                    if match:
-                        year = int(match.group(1))
-                        break
-
-        # 获取播放时长
-        duration = get_duration(audio)
-
-        # 获取文件扩展名作为格式
-        ext = os.path.splitext(file_path)[1].lower().lstrip('.')
-
-        return {
-            'title': title,
-            'artist': artist,
-            'album': album,
-            'year': year,
-            'genre': genre,
-            'duration': duration,
-            'format': ext
-        }
+        return _read_metadata(file_path)
     except Exception as e:
         print(f"提取元数据失败 {file_path}: {e}")
         return None
 
 
+def _read_metadata(file_path):
+    """
+    读取音频文件元数据（出错时抛出异常，由调用方处理）
+
+    Args:
+        file_path: 音频文件的绝对路径
+
+    Returns:
+        dict or None: 元数据字典，无法识别的文件返回 None
+    """
+    # 使用 mutagen 读取音频文件
+    audio = File(file_path)
+    if audio is None:
+        return None
+
+    # 标签只检查一次，没有标签的文件各字段均为 None
+    title = artist = album = genre = year = None
+    tags = getattr(audio, 'tags', None)
+    if tags is not None:
+        title = _pick_tag(tags, _TITLE_KEYS)
+        artist = _pick_tag(tags, _ARTIST_KEYS)
+        album = _pick_tag(tags, _ALBUM_KEYS)
+        genre = _pick_tag(tags, _GENRE_KEYS)
+
+        # 提取年份：尝试多种 ID3 年份标签格式
+        for key in _YEAR_KEYS:
+            value = _pick_tag(tags, (key,))
+            if value:
+                # 使用预编译的正则表达式提取 4 位数年份
+                match = _YEAR_RE.search(value)
+                if match:
+                    year = int(match.group())
+                    break
+
+    # 获取播放时长
+    duration = get_duration(audio)
+
+    # 获取文件扩展名作为格式
+    ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+
+    return {
+        'title': title,
+        'artist': artist,
+        'album': album,
+        'year': year,
+        'genre': genre,
+        'duration': duration,
+        'format': ext
+    }
+
+
 # ==================== 扫描功能 ====================
 
 def scan_directory(directory):
@@ -161,56 +201,146 @@ def scan_directory(directory):
     扫描目录下的所有音乐文件
 
     递归遍历目录，查找支持的音频文件，提取元数据并添加到数据库
+    修改时间与数据库记录一致的文件视为未变化，直接跳过；
+    已入库但被修改过的文件会重新提取元数据并更新记录
 
     Args:
         directory: 要扫描的目录路径
 
     Returns:
-        int: 成功添加的歌曲数量
+        int: 成功添加或更新的歌曲数量
     """
     music_dir = Path(directory)
     if not music_dir.exists():
         print(f"目录不存在: {directory}")
         return 0
 
-    added_count = 0
+    # 已入库文件的修改时间，一次查询取出
+    known_mtimes = db.get_file_mtimes()
 
-    # os.walk 递归遍历目录
-    for root, dirs, files in os.walk(music_dir):
-        for file in files:
-            # 获取文件扩展名
-            ext = os.path.splitext(file)[1].lower()
-
-            # 只处理支持的音频格式
-            if ext not in SUPPORTED_EXTENSIONS:
-                continue
-
-            # 完整文件路径
-            file_path = os.path.join(root, file)
-
-            # 提取元数据
-            metadata = extract_metadata(file_path)
-
-            if metadata:
-                # 如果没有标题，使用文件名作为标题
-                title = metadata['title'] or os.path.splitext(file)[0]
-
-                # 添加到数据库
-                db.add_music(
-                    file_path=file_path,
-                    title=title,
-                    artist=metadata['artist'],
-                    album=metadata['album'],
-                    year=metadata['year'],
-                    genre=metadata['genre'],
-                    duration=metadata['duration'],
-                    format=metadata['format']
-                )
-                added_count += 1
+    # 先收集所有新增或修改过的音频文件
+    file_paths = []
+    mtimes = {}
+    for file_path, mtime in _iter_audio_files(os.fspath(music_dir)):
+        if known_mtimes.get(file_path) == mtime:
+            continue
+        file_paths.append(file_path)
+        mtimes[file_path] = mtime
+
+    added_count = 0
+    pending = []
+
+    # 元数据提取在子进程中并行完成，数据库写入留在当前进程，避免 SQLite 写入竞争
+    # 结果边解析边写入：写入一批数据时，子进程继续解析后续文件
+    for file_path, metadata, error in _extract_all(file_paths):
+        if error:
+            print(f"提取元数据失败 {file_path}: {error}")
+            continue
+
+        if metadata:
+            # 如果没有标题，使用文件名作为标题
+            title = metadata['title'] or os.path.splitext(os.path.basename(file_path))[0]
+
+            pending.append({
+                'file_path': file_path,
+                'title': title,
+                'artist': metadata['artist'],
+                'album': metadata['album'],
+                'year': metadata['year'],
+                'genre': metadata['genre'],
+                'duration': metadata['duration'],
+                'format': metadata['format'],
+                'mtime': mtimes[file_path]
+            })
+            added_count += 1
+
+            # 批量添加到数据库，每批只提交一次
+            if len(pending) >= _FLUSH_SIZE:
+                db.add_music_bulk(pending, update_existing=True)
+                pending = []
+
+    if pending:
+        db.add_music_bulk(pending, update_existing=True)
 
     return added_count
 
 
+def _iter_audio_files(directory):
+    """
+    递归遍历目录，找出支持的音频文件
+
+    使用 os.scandir：目录项的类型随目录列表一起返回，判断文件/目录无需额外的 stat；
+    不进入目录的符号链接（与 os.walk 默认行为一致），无法读取的目录直接跳过
+
+    Args:
+        directory: 目录路径
+
+    Yields:
+        tuple: (文件路径, 修改时间 st_mtime)
+    """
+    pending_dirs = [directory]
+    while pending_dirs:
+        try:
+            entries = os.scandir(pending_dirs.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file():
+                        # 只处理支持的音频格式（直接切出扩展名，不经过 os.path.splitext）
+                        name = entry.name
+                        dot = name.rfind('.')
+                        if dot > 0 and name[dot:].lower() in SUPPORTED_EXTENSIONS:
+                            yield entry.path, entry.stat().st_mtime
+                except OSError:
+                    continue
+
+
+def _extract_for_scan(file_path):
+    """
+    提取单个文件的元数据（在子进程中运行）
+
+    异常不在子进程中打印，而是返回给主进程统一输出
+
+    Args:
+        file_path: 音频文件路径
+
+    Returns:
+        tuple: (file_path, 元数据字典或 None, 错误信息或 None)
+    """
+    try:
+        return file_path, _read_metadata(file_path), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+
+def _extract_all(file_paths):
+    """
+    提取一批文件的元数据
+
+    文件较多时使用进程池并行解析（标签解析是 CPU 密集型操作），
+    结果按 file_paths 的顺序逐个产出：调用方写入数据库时，子进程继续解析后面的文件
+
+    Args:
+        file_paths: 音频文件路径列表
+
+    Yields:
+        tuple: 每个文件的 (file_path, 元数据字典或 None, 错误信息或 None)
+    """
+    if len(file_paths) < _PARALLEL_MIN_FILES or _MAX_WORKERS < 2:
+        # 在当前进程中逐个提取，extract_metadata 自行输出错误
+        for file_path in file_paths:
+            yield file_path, extract_metadata(file_path), None
+        return
+
+    with ProcessPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        # executor.map 立即提交全部任务，按顺序取结果时不必等待所有文件解析完成
+        yield from executor.map(_extract_for_scan, file_paths, chunksize=_CHUNK_SIZE)
+
+
 def scan_music():
     """
     扫描配置中指定的音乐目录
@@ -220,7 +350,7 @@ def scan_music():
     Returns:
         int: 成功添加的歌曲数量
     """
-    print(f"正在扫描音乐目录: {config.MUSIC_DIR}")
-    count = scan_directory(config.MUSIC_DIR)
+    print(f"正在扫描音乐目录: {config.MUSIC_DIR_STR}")
+    count = scan_directory(config.MUSIC_DIR_STR)
     print(f"扫描完成，共添加 {count} 首歌曲")
     return count
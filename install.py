@@ -13,9 +13,9 @@ AI Music Player MCP 安装脚本
 - 其他支持 MCP 的客户端
 """
 
-import os
 import sys
 import json
+import shutil
 import subprocess
 from pathlib import Path
 
@@ -26,6 +26,15 @@ RED = "\033[91m"
 BLUE = "\033[94m"
 RESET = "\033[0m"
 
+# 运行 MCP 服务器所需的模块：导入名 -> pip 包名
+REQUIRED_MODULES = {
+    "fastmcp": "fastmcp",
+    "pygame": "pygame",
+    "mutagen": "mutagen",
+    "sqlalchemy": "sqlalchemy",
+    "dotenv": "python-dotenv",
+}
+
 
 def print_success(msg):
     print(f"{GREEN}✓{RESET} {msg}")
@@ -69,11 +78,18 @@ def create_venv():
         print_warning("虚拟环境已存在")
         return venv_path
 
-    print_info("正在创建虚拟环境...")
+    # uv venv 通常不到 1 秒即可完成，标准库 venv 需要数秒（Windows 上更慢）
+    # --seed 安装 pip，uv 不可用时 install_dependencies 仍可回退到 pip
+    uv = shutil.which("uv")
+    if uv:
+        print_info("正在使用 uv 创建虚拟环境...")
+        command = [uv, "venv", str(venv_path), "--python", sys.executable, "--seed"]
+    else:
+        print_info("正在创建虚拟环境（安装 uv 可以显著加快此步骤）...")
+        command = [sys.executable, "-m", "venv", str(venv_path)]
 
     try:
-        subprocess.run([sys.executable, "-m", "venv", str(venv_path)],
-                       check=True, capture_output=True)
+        subprocess.run(command, check=True, capture_output=True)
         print_success(f"虚拟环境已创建: {venv_path}")
         return venv_path
     except Exception as e:
@@ -81,18 +97,39 @@ def create_venv():
         return None
 
 
+def dependencies_satisfied(python_path) -> bool:
+    """检查指定的 Python 解释器能否导入所有依赖（-I 隔离模式，不受当前目录影响）"""
+    result = subprocess.run([str(python_path), "-I", "-c", f"import {', '.join(REQUIRED_MODULES)}"],
+                            capture_output=True)
+    return result.returncode == 0
+
+
 def install_dependencies(venv_python: Path):
     """在虚拟环境中安装依赖"""
+    # 依赖都已安装时跳过 pip（pip install -e . 即使无需更新也要数秒）
+    if dependencies_satisfied(venv_python):
+        print_success("依赖已安装，跳过")
+        return True
+
     print_info("正在安装依赖...")
 
-    try:
-        subprocess.run([str(venv_python), "-m", "pip", "install", "-e", "."],
-                       check=True, capture_output=True)
-        print_success("依赖安装成功!")
-        return True
-    except subprocess.CalledProcessError as e:
-        print_error(f"依赖安装失败")
-        return False
+    # 优先使用 uv（解析和安装都快得多，并复用全局缓存），失败或未安装时使用 pip
+    commands = []
+    uv = shutil.which("uv")
+    if uv:
+        commands.append([uv, "pip", "install", "--python", str(venv_python), "-e", "."])
+    commands.append([str(venv_python), "-m", "pip", "install", "-e", "."])
+
+    for command in commands:
+        try:
+            subprocess.run(command, check=True, capture_output=True)
+            print_success("依赖安装成功!")
+            return True
+        except subprocess.CalledProcessError:
+            continue
+
+    print_error("依赖安装失败")
+    return False
 
 
 def get_env_config():
@@ -109,15 +146,13 @@ def get_env_config():
     if env_file.exists():
         print_info(f"从 {env_file.name} 读取配置...")
         try:
-            with open(env_file) as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith("#") and "=" in line:
-                        key, value = line.split("=", 1)
-                        key = key.strip()
-                        value = value.strip()
-                        if key:
-                            env_config[key] = value
+            # 一次读入整个文件，跳过空行、注释和没有 "=" 的行
+            # 与 python-dotenv 一致按 UTF-8 读取，无法解码的字节不中断读取
+            text = env_file.read_text(encoding="utf-8", errors="replace")
+            lines = (line.strip() for line in text.splitlines())
+            pairs = (line.split("=", 1) for line in lines
+                     if line and not line.startswith("#") and "=" in line)
+            env_config = {key.strip(): value.strip() for key, value in pairs if key.strip()}
         except Exception as e:
             print_warning(f"读取配置文件失败: {e}")
     else:
@@ -138,20 +173,18 @@ def generate_mcp_config(python_path: str, script_path: str, env_config: dict, us
                 "--python",
                 "python3",
                 "ai-music-player"
-            ],
-            "env": env_config
+            ]
         }
     else:
         # 使用 Python 脚本方式
         server_config = {
             "command": python_path,
-            "args": [script_path],
-            "env": env_config
+            "args": [script_path]
         }
 
-    # 如果 env 为空，移除 env 字段
-    if not server_config["env"]:
-        del server_config["env"]
+    # 只有 env 不为空时才添加 env 字段
+    if env_config:
+        server_config["env"] = env_config
 
     # Cherry Studio 格式 - 尝试 mcpServers
     config = {
@@ -209,30 +242,27 @@ def main():
 
     # 安装依赖
     if use_venv:
-        install_dependencies(venv_python)
-
-        # 检查依赖是否安装成功
-        try:
-            subprocess.run([str(venv_python), "-c", "import fastmcp; import pygame"],
-                           check=True, capture_output=True)
-            print_success("依赖检查通过")
-        except:
+        # install_dependencies 已检查过依赖或确认安装成功，无需再次检查
+        if not install_dependencies(venv_python):
             print_error("依赖安装可能有问题，请检查")
     else:
         # 检查依赖
         print("\n检查依赖...")
         missing = []
-        for pkg in ["fastmcp", "pygame", "mutagen", "sqlalchemy", "dotenv"]:
+        for module, package in REQUIRED_MODULES.items():
             try:
-                __import__(pkg.replace("-", "_"))
+                __import__(module)
             except ImportError:
-                missing.append(pkg)
+                missing.append(package)
 
         if missing:
             print_warning(f"缺少依赖: {', '.join(missing)}")
             response = input("是否现在安装? [Y/n]: ").strip().lower()
             if response != "n":
-                os.system(f'{python_path} -m pip install {" ".join(missing)}')
+                # 所有缺少的包一次安装；参数列表直接传给 pip，不经过 shell
+                result = subprocess.run([python_path, "-m", "pip", "install", *missing])
+                if result.returncode != 0:
+                    print_error("依赖安装失败")
 
     # 获取环境变量配置
     env_config = get_env_config()
@@ -259,11 +289,12 @@ def main():
 
     # 生成配置
     config = generate_mcp_config(python_path, script_path, env_config, use_uvx)
+    # 只序列化一次，写入文件和打印共用
+    config_json = json.dumps(config, indent=2, ensure_ascii=False)
 
-    # 保存到文件
+    # 保存到文件（一次写入，固定 UTF-8 编码）
     config_file = script_dir / "mcp_config.json"
-    with open(config_file, "w") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    config_file.write_text(config_json + "\n", encoding="utf-8")
 
     print("\n" + "=" * 60)
     print_success("MCP 配置已生成!")
@@ -273,7 +304,7 @@ def main():
     print(f"\n{'='*60}")
     print("MCP 配置内容 (复制到你的 MCP 客户端):")
     print("=" * 60)
-    print(json.dumps(config, indent=2, ensure_ascii=False))
+    print(config_json)
     print("=" * 60)
 
     print("\n" + "-" * 60)
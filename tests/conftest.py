@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+pytest 公共配置与 fixture
+
+提供基于内存 SQLite 的测试数据库，数据库相关测试不再依赖开发者本机的 music.db
+以及 MCP 工具测试使用的模拟播放器
+"""
+
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# 测试数据：(file_path, title, artist, album, year, genre, duration, format)
+_SEED_MUSIC = [
+    ("/music/qilixiang.mp3", "七里香", "周杰伦", "七里香", 2004, "Pop", 299, "mp3"),
+    ("/music/daoxiang.mp3", "稻香", "周杰伦", "魔杰座", 2008, "Pop", 223, "mp3"),
+    ("/music/test_song.flac", "测试歌曲", "Test Artist", "Test Album", 1995, "Rock", 180, "flac"),
+    ("/music/hotel.mp3", "Hotel California", "Eagles", "Hotel California", 1976, "Rock", 391, "mp3"),
+    ("/music/unknown.wav", "Unknown", None, None, None, None, 60, "wav"),
+]
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """
+    创建空的内存数据库引擎（整个测试会话只建一次表）
+
+    模型测试通过 session fixture 使用，每个测试结束后回滚，表始终为空
+    """
+    from database.models import Base
+
+    engine = create_engine("sqlite:///:memory:", poolclass=StaticPool)
+
+    # sqlite3 驱动自行管理事务，SAVEPOINT 无法正确嵌套
+    # 关闭驱动的事务处理，由 SQLAlchemy 显式发出 BEGIN
+    @event.listens_for(engine, "connect")
+    def _disable_driver_transactions(dbapi_conn, connection_record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    """
+    创建数据库会话，测试结束后回滚全部修改
+
+    会话加入外层事务，commit() 只提交保存点（SAVEPOINT），
+    测试结束时回滚外层事务，不需要为每个测试重新建表
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """
+    创建内存数据库引擎并写入测试数据（整个测试会话只创建一次）
+
+    StaticPool 让所有会话共用同一个连接，否则每个连接都是一个新的空内存数据库
+    """
+    from database.models import Base, Music
+
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    session = Session()
+    try:
+        columns = ('file_path', 'title', 'artist', 'album', 'year', 'genre', 'duration', 'format')
+        session.add_all(Music(**dict(zip(columns, row))) for row in _SEED_MUSIC)
+        session.commit()
+    finally:
+        session.close()
+
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def db_session(db_engine):
+    """
+    让 database.db 的查询函数使用内存数据库
+
+    替换 db 模块中的 get_session / new_session（db 模块导入时已绑定这两个名称，
+    只替换 database.models 中的不生效），并清除 db 模块中缓存的查询结果
+    """
+    import database.db
+    import ai_music_player.database.db
+
+    Session = sessionmaker(bind=db_engine, expire_on_commit=False)
+    modules = (database.db, ai_music_player.database.db)
+
+    with pytest.MonkeyPatch.context() as mp:
+        for module in modules:
+            mp.setattr(module, "get_session", Session)
+            mp.setattr(module, "new_session", Session)
+            module.clear_library_cache()
+            module._invalidate_preferences()
+
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # 恢复后清除缓存，避免内存数据库的结果被后续测试读到
+    for module in modules:
+        module.clear_library_cache()
+        module._invalidate_preferences()
+
+
+@pytest.fixture
+def file_engine(tmp_path, monkeypatch):
+    """
+    让 database.models / database.db 使用临时目录中的空数据库文件
+
+    与正式数据库一样注册连接 PRAGMA；只创建引擎、不建表，
+    需要旧版表结构的迁移测试可以先自行建表再调用 init_db()
+    init_db() 设置的全文索引开关在测试结束后恢复
+    """
+    import database.models as models
+    import database.db
+    import ai_music_player.database.db
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'music.db'}")
+    event.listen(engine, "connect", models._configure_connection)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    modules = (database.db, ai_music_player.database.db)
+
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setattr(models, "_fts_enabled", False)
+    for module in modules:
+        monkeypatch.setattr(module, "get_session", Session)
+        monkeypatch.setattr(module, "new_session", Session)
+        module.clear_library_cache()
+        module._invalidate_preferences()
+
+    yield engine
+
+    engine.dispose()
+    for module in modules:
+        module.clear_library_cache()
+        module._invalidate_preferences()
+
+
+@pytest.fixture
+def file_db(file_engine):
+    """
+    在临时数据库文件上执行 init_db()（建表、索引、FTS5 全文索引）
+
+    Returns:
+        sessionmaker: 绑定到该数据库的会话工厂，用于准备测试数据和检查结果
+    """
+    from database.models import init_db
+
+    init_db()
+    return sessionmaker(bind=file_engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def player_mock(monkeypatch):
+    """
+    替换 MCP 服务器的 get_player，返回模拟播放器
+
+    测试只需设置返回值，例如 player_mock.pause.return_value = True
+    使用 Mock(spec=MusicPlayer)：不预先配置魔术方法，访问播放器没有的方法时直接报错
+    """
+    import ai_music_player.__main__ as mcp_server
+
+    player = Mock(spec=mcp_server.MusicPlayer)
+    monkeypatch.setattr(mcp_server, "get_player", lambda: player)
+    return player
@@ -5,12 +5,42 @@
 测试 config.py 中的配置项
 """
 
+import importlib
+import os
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 
+@pytest.fixture
+def reload_config(monkeypatch):
+    """
+    按需重新加载 config 模块
+
+    记录 config 上次加载时的 MUSIC_DIR 环境变量值，
+    仅当环境变量与之不同才执行 importlib.reload，
+    测试结束后撤销环境变量修改并恢复 config，避免影响其他测试
+    """
+    import config
+
+    # 测试开始时 config 与当前环境变量一致（上一个测试结束时已恢复）
+    loaded = {"MUSIC_DIR": os.environ.get("MUSIC_DIR")}
+
+    def _reload():
+        music_dir = os.environ.get("MUSIC_DIR")
+        if music_dir != loaded["MUSIC_DIR"]:
+            importlib.reload(config)
+            loaded["MUSIC_DIR"] = music_dir
+        return config
+
+    yield _reload
+
+    monkeypatch.undo()
+    _reload()
+
+
 class TestConfig:
     """配置模块测试类"""
 
@@ -29,6 +59,12 @@ class TestConfig:
         import config
         assert config.DATABASE_PATH.is_relative_to(config.BASE_DIR)
 
+    def test_path_strings_match_paths(self):
+        """测试 MUSIC_DIR_STR / DATABASE_PATH_STR 与对应的 Path 一致"""
+        import config
+        assert config.MUSIC_DIR_STR == str(config.MUSIC_DIR)
+        assert config.DATABASE_PATH_STR == str(config.DATABASE_PATH)
+
     def test_supported_formats_contains_common_formats(self):
         """测试 SUPPORTED_FORMATS 是否包含常见音频格式"""
         import config
@@ -57,7 +93,7 @@ class TestConfig:
 class TestConfigWithEnv:
     """环境变量配置测试类"""
 
-    def test_music_dir_custom_from_env(self, monkeypatch, tmp_path):
+    def test_music_dir_custom_from_env(self, monkeypatch, tmp_path, reload_config):
         """测试 MUSIC_DIR 是否可自定义"""
         custom_dir = tmp_path / "custom_music"
         custom_dir.mkdir()
@@ -65,9 +101,18 @@ class TestConfigWithEnv:
         # 注意：这个测试会受环境变量影响
         monkeypatch.setenv("MUSIC_DIR", str(custom_dir))
 
-        import importlib
-        import config as config_module
-        importlib.reload(config_module)
+        config_module = reload_config()
 
         # 由于 MUSIC_DIR 使用 Path，需要测试其行为
         assert isinstance(config_module.MUSIC_DIR, Path)
+        assert config_module.MUSIC_DIR == custom_dir
+
+    def test_reload_skipped_when_env_unchanged(self, reload_config):
+        """测试 MUSIC_DIR 未变化时不重新加载 config"""
+        import config
+
+        with patch("importlib.reload") as mock_reload:
+            config_module = reload_config()
+
+        assert config_module is config
+        mock_reload.assert_not_called()
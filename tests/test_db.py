@@ -3,27 +3,20 @@
 数据库操作单元测试
 
 测试 ai_music_player/database/db.py 中的数据库操作函数
-使用项目的实际数据库进行测试
+使用内存数据库进行测试（见 conftest.py 的 db_session fixture）
 """
 
-import os
-import sys
-import pytest
+import logging
 
-# 添加项目根目录和 ai_music_player 目录到路径
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, project_root)
-sys.path.insert(0, os.path.join(project_root, 'ai_music_player'))
+import pytest
+from sqlalchemy import select, text
 
 from ai_music_player.database.models import Music
 
 
-# 使用项目的实际数据库
-TEST_DB_PATH = "/Users/huzhiwei/ai/aiplaymusic/music.db"
-
-
+@pytest.mark.usefixtures("db_session")
 class TestQueryMusic:
-    """查询音乐测试类（使用实际数据库）"""
+    """查询音乐测试类（使用内存数据库）"""
 
     def test_get_all_music(self):
         """测试获取所有音乐"""
@@ -31,6 +24,7 @@ class TestQueryMusic:
 
         all_music = db.get_all_music()
         assert isinstance(all_music, list)
+        assert len(all_music) == 5
 
     def test_get_music_by_artist(self):
         """测试按艺术家查询"""
@@ -39,13 +33,15 @@ class TestQueryMusic:
         # 查询一个存在的艺术家
         results = db.get_music_by_artist("周")
         assert isinstance(results, list)
+        assert {m.title for m in results} == {"七里香", "稻香"}
 
     def test_get_music_by_artist_case_insensitive(self):
         """测试艺术家查询大小写不敏感"""
         import database.db as db
 
-        results = db.get_music_by_artist("zhou")
+        results = db.get_music_by_artist("EAGLES")
         assert isinstance(results, list)
+        assert [m.title for m in results] == ["Hotel California"]
 
     def test_get_music_by_title(self):
         """测试按标题查询"""
@@ -53,6 +49,34 @@ class TestQueryMusic:
 
         results = db.get_music_by_title("测试")
         assert isinstance(results, list)
+        assert [m.title for m in results] == ["测试歌曲"]
+
+    def test_get_music_by_year_range_inclusive(self):
+        """测试年份区间查询包含起止年份"""
+        import database.db as db
+
+        results = db.get_music_by_year_range(1995, 2004)
+        assert sorted(m.year for m in results) == [1995, 2004]
+        assert [m.title for m in db.get_music_by_year_range(1976, 1976)] == ["Hotel California"]
+        assert db.get_music_by_year_range(2005, 2007) == []
+
+    def test_get_music_by_year_range_excludes_null_year(self):
+        """测试没有年份的歌曲不会出现在任何年份区间中"""
+        import database.db as db
+
+        results = db.get_music_by_year_range(0, 9999)
+        assert len(results) == 4
+        assert "Unknown" not in {m.title for m in results}
+
+    def test_get_music_rows_by_year_range(self):
+        """测试按年份区间查询轻量记录（包含两端，可与其他条件组合）"""
+        import database.db as db
+
+        rows = db.get_music_rows(year_range=(2000, 2009))
+        assert sorted(row.title for row in rows) == ["七里香", "稻香"]
+        assert not isinstance(rows[0], Music)
+        rock = db.get_music_rows(year_range=(1976, 1995), genre="Rock")
+        assert sorted(row.year for row in rock) == [1976, 1995]
 
     def test_get_random_music(self):
         """测试随机获取音乐"""
@@ -64,6 +88,7 @@ class TestQueryMusic:
             assert random_track.file_path is not None
 
 
+@pytest.mark.usefixtures("db_session")
 class TestListQueries:
     """列表查询测试类"""
 
@@ -73,6 +98,7 @@ class TestListQueries:
 
         artists = db.get_all_artists()
         assert isinstance(artists, list)
+        assert sorted(artists) == ["Eagles", "Test Artist", "周杰伦"]
 
     def test_get_all_genres(self):
         """测试获取所有风格"""
@@ -82,6 +108,7 @@ class TestListQueries:
         assert isinstance(genres, list)
 
 
+@pytest.mark.usefixtures("db_session")
 class TestPreferences:
     """用户偏好测试类"""
 
@@ -105,6 +132,477 @@ class TestPreferences:
         assert isinstance(recommendations, list)
 
 
+class TestAddMusicBulk:
+    """批量添加音乐测试类（使用临时数据库文件）"""
+
+    def _tracks(self, Session):
+        """返回 {file_path: (title, mtime)}"""
+        from database.models import Music
+
+        with Session() as session:
+            return {path: (title, mtime) for path, title, mtime in session.execute(
+                select(Music.file_path, Music.title, Music.mtime)
+            )}
+
+    def test_skips_existing_file_paths(self, file_db):
+        """测试已存在的 file_path（包括同一批内重复的路径）被跳过"""
+        import database.db as db
+
+        assert db.add_music_bulk([
+            {'file_path': '/music/a.mp3', 'title': 'A', 'mtime': 1.0},
+            {'file_path': '/music/b.mp3', 'title': 'B', 'mtime': 1.0},
+        ]) == 2
+
+        added = db.add_music_bulk([
+            {'file_path': '/music/a.mp3', 'title': 'A (new)', 'mtime': 2.0},
+            {'file_path': '/music/c.mp3', 'title': 'C', 'mtime': 2.0},
+            {'file_path': '/music/c.mp3', 'title': 'C (dup)', 'mtime': 3.0},
+        ])
+
+        assert added == 1
+        assert self._tracks(file_db) == {
+            '/music/a.mp3': ('A', 1.0),
+            '/music/b.mp3': ('B', 1.0),
+            '/music/c.mp3': ('C', 2.0),
+        }
+
+    def test_update_existing_overwrites(self, file_db):
+        """测试 update_existing=True 时覆盖已存在记录的元数据和 mtime，同时添加新记录"""
+        import database.db as db
+
+        db.add_music_bulk([{'file_path': '/music/a.mp3', 'title': 'A', 'mtime': 1.0}])
+
+        added = db.add_music_bulk([
+            {'file_path': '/music/a.mp3', 'title': 'A (retagged)', 'mtime': 5.0},
+            {'file_path': '/music/b.mp3', 'title': 'B', 'mtime': 5.0},
+        ], update_existing=True)
+
+        assert added == 2
+        assert self._tracks(file_db) == {
+            '/music/a.mp3': ('A (retagged)', 5.0),
+            '/music/b.mp3': ('B', 5.0),
+        }
+
+    def test_more_rows_than_batch_size(self, file_db):
+        """测试超过单批数量（_BULK_BATCH_SIZE）的输入分批全部写入"""
+        import database.db as db
+
+        total = db._BULK_BATCH_SIZE * 2 + 1
+        rows = [{'file_path': f'/music/{i}.mp3', 'title': str(i)} for i in range(total)]
+
+        assert db.add_music_bulk(rows) == total
+        # 再次写入时每一批都全部跳过
+        assert db.add_music_bulk(rows) == 0
+        assert len(self._tracks(file_db)) == total
+        assert len(db.get_all_music()) == total
+
+    def test_empty_input(self, file_db):
+        """测试空列表直接返回 0"""
+        import database.db as db
+
+        assert db.add_music_bulk([]) == 0
+
+
+class TestFullTextSearch:
+    """FTS5 全文索引测试类（使用 init_db 创建的临时数据库文件）"""
+
+    @pytest.fixture(autouse=True)
+    def library(self, file_db):
+        """写入测试歌曲，返回会话工厂"""
+        import database.db as db
+
+        db.add_music_bulk([
+            {'file_path': '/music/hotel.mp3', 'title': 'Hotel California', 'artist': 'Eagles', 'album': 'Hotel California'},
+            {'file_path': '/music/qilixiang.mp3', 'title': '七里香', 'artist': '周杰伦', 'album': '七里香'},
+            {'file_path': '/music/hello.mp3', 'title': 'Say "Hello" Again', 'artist': 'Quote Band', 'album': None},
+        ])
+        return file_db
+
+    def _fts_rowids(self, session, query):
+        """直接查询全文索引，返回匹配的 rowid 集合"""
+        return set(session.scalars(
+            text("SELECT rowid FROM music_fts WHERE music_fts MATCH :q"), {'q': query}
+        ))
+
+    def test_fts_enabled(self):
+        """测试 init_db 创建了全文索引"""
+        from database.models import fts_enabled
+
+        assert fts_enabled() is True
+
+    def test_substring_match(self):
+        """测试子串匹配（英文、中文）"""
+        import database.db as db
+
+        assert [m.title for m in db.get_music_by_artist("agle")] == ["Hotel California"]
+        assert [m.title for m in db.get_music_by_title("里香")] == ["七里香"]
+        assert [m.title for m in db.get_music_by_title("七里香")] == ["七里香"]
+
+    def test_case_insensitive(self):
+        """测试大小写不敏感"""
+        import database.db as db
+
+        assert [m.title for m in db.get_music_by_artist("EAGLES")] == ["Hotel California"]
+        assert [m.title for m in db.search_music("hotel CALIF")] == ["Hotel California"]
+
+    def test_keyword_with_quotes(self):
+        """测试关键词包含双引号（成对或不成对）时正常查询"""
+        import database.db as db
+
+        assert [m.artist for m in db.get_music_by_title('"Hello"')] == ["Quote Band"]
+        assert [m.artist for m in db.get_music_by_title('Say "Hel')] == ["Quote Band"]
+        assert db.get_music_by_title('"""') == []
+
+    def test_short_keyword_falls_back_to_like(self):
+        """测试少于 3 个字符的关键词使用 ILIKE 查询"""
+        import database.db as db
+
+        condition, params = db._text_match("周杰", 'artist')
+        assert params == {'artist_pattern': '%周杰%'}
+        assert [m.title for m in db.get_music_by_artist("周杰")] == ["七里香"]
+        assert [m.title for m in db.get_music_by_artist("ea")] == ["Hotel California"]
+
+    def test_index_follows_update(self, library):
+        """测试更新 music 表后全文索引同步"""
+        from database.models import Music
+        import database.db as db
+
+        with library() as session:
+            music = session.scalars(select(Music).filter_by(artist='Eagles')).one()
+            music.artist = 'The Falcons'
+            session.commit()
+            music_id = music.id
+
+            assert self._fts_rowids(session, '{artist} : "Eagles"') == set()
+            assert self._fts_rowids(session, '{artist} : "Falcons"') == {music_id}
+
+        assert db.get_music_by_artist("Eagles") == []
+        assert [m.title for m in db.get_music_by_artist("falcon")] == ["Hotel California"]
+
+    def test_index_follows_delete(self, library):
+        """测试删除 music 记录后全文索引同步"""
+        import database.db as db
+
+        assert db.delete_music('/music/hotel.mp3') is True
+
+        with library() as session:
+            assert self._fts_rowids(session, '"Hotel"') == set()
+        assert db.get_music_by_title("Hotel") == []
+        assert [m.title for m in db.get_music_by_title("七里香")] == ["七里香"]
+
+
+class TestFullTextIndexInit:
+    """全文索引初始化测试类"""
+
+    def test_rebuild_existing_rows_on_first_init(self, file_engine):
+        """测试首次创建全文索引时为已有歌曲建立索引"""
+        from sqlalchemy.orm import Session
+        from database.models import Base, Music, init_db
+        import database.db as db
+
+        # 模拟旧数据库：music 表中已有数据，但还没有 music_fts
+        Base.metadata.create_all(file_engine)
+        with Session(file_engine) as session:
+            session.add(Music(file_path='/music/old.mp3', title='Old Favourite', artist='Legacy'))
+            session.commit()
+
+        init_db()
+
+        assert [m.title for m in db.get_music_by_title("favour")] == ["Old Favourite"]
+        assert [m.title for m in db.get_music_by_artist("LEGACY")] == ["Old Favourite"]
+
+    def test_falls_back_to_like_without_fts5(self, file_engine, monkeypatch, caplog, capsys):
+        """测试不支持 trigram 分词器时记录警告（不写 stdout），搜索退化为 ILIKE"""
+        import database.models as models
+        import database.db as db
+
+        # 模拟 SQLite 不支持 trigram：创建全文索引时报 OperationalError
+        ddl = [models._FTS_DDL[0].replace("'trigram'", "'no_such_tokenizer'")]
+        monkeypatch.setattr(models, "_FTS_DDL", ddl)
+
+        with caplog.at_level(logging.WARNING):
+            models.init_db()
+
+        assert models.fts_enabled() is False
+        assert any(r.levelno == logging.WARNING and "全文索引不可用" in r.message for r in caplog.records)
+        assert capsys.readouterr().out == ""
+
+        db.add_music_bulk([{'file_path': '/music/a.mp3', 'title': 'Hotel California'}])
+        assert [m.title for m in db.get_music_by_title("CALIF")] == ["Hotel California"]
+
+
+class TestRecordPlay:
+    """播放记录与偏好累加测试类（使用临时数据库文件）"""
+
+    @pytest.fixture(autouse=True)
+    def track_ids(self, file_db):
+        """写入两首歌曲，返回 (歌曲 ID 列表, 会话工厂)"""
+        import database.db as db
+        from database.models import Music
+
+        db.add_music_bulk([
+            {'file_path': '/music/qilixiang.mp3', 'title': '七里香', 'artist': '周杰伦',
+             'album': '七里香', 'genre': 'Pop', 'year': 2004},
+            {'file_path': '/music/unknown.wav', 'title': 'Unknown', 'artist': '周杰伦',
+             'album': None, 'genre': None, 'year': None},
+        ])
+        with file_db() as session:
+            ids = list(session.scalars(select(Music.id).order_by(Music.file_path)))
+        return ids, file_db
+
+    def _preferences(self, Session):
+        """返回 {(维度, 值): 播放次数}"""
+        from database.models import UserPreference
+
+        with Session() as session:
+            return {
+                (category, value): count for category, value, count in session.execute(
+                    select(UserPreference.category, UserPreference.value, UserPreference.play_count)
+                )
+            }
+
+    def test_record_play_increments_counts(self, track_ids):
+        """测试重复播放同一首歌时各维度的播放次数逐次累加"""
+        import database.db as db
+
+        (qilixiang, unknown), Session = track_ids
+
+        for _ in range(3):
+            db.record_play(qilixiang)
+
+        assert self._preferences(Session) == {
+            ('artist', '周杰伦'): 3,
+            ('album', '七里香'): 3,
+            ('genre', 'Pop'): 3,
+            ('decade', '2000'): 3,
+        }
+
+    def test_record_play_skips_empty_fields(self, track_ids):
+        """测试空字段不产生偏好记录，但播放历史照常写入"""
+        from sqlalchemy import func
+        from database.models import PlayHistory
+        import database.db as db
+
+        (qilixiang, unknown), Session = track_ids
+
+        for music_id in (qilixiang, qilixiang, unknown, qilixiang):
+            db.record_play(music_id)
+
+        assert self._preferences(Session) == {
+            ('artist', '周杰伦'): 4,
+            ('album', '七里香'): 3,
+            ('genre', 'Pop'): 3,
+            ('decade', '2000'): 3,
+        }
+        with Session() as session:
+            assert session.scalar(select(func.count()).select_from(PlayHistory)) == 4
+
+
+class TestRankedPreferences:
+    """偏好排名测试类（使用临时数据库文件）"""
+
+    @pytest.fixture(autouse=True)
+    def preferences(self, file_db):
+        """写入超过名额的歌手、年代、风格、专辑偏好"""
+        from database.models import UserPreference
+
+        counts = {
+            'artist': {'A1': 10, 'A2': 70, 'A3': 30, 'A4': 50, 'A5': 20, 'A6': 60, 'A7': 40},
+            'decade': {'1970': 5, '1980': 9, '1990': 7, '2000': 8},
+            'genre': {'Pop': 3, 'Rock': 6, 'Jazz': 4, 'Folk': 5},
+            'album': {'X': 100, 'Y': 90, 'Z': 80, 'W': 70},
+        }
+        with file_db() as session:
+            session.add_all(
+                UserPreference(category=category, value=value, play_count=count)
+                for category, values in counts.items()
+                for value, count in values.items()
+            )
+            session.commit()
+
+    def test_get_user_preferences_top_lists(self):
+        """测试每个维度只保留名额内的偏好值，并按播放次数降序排列"""
+        import database.db as db
+
+        assert db.get_user_preferences() == {
+            'top_artists': ['A2', 'A6', 'A4', 'A7', 'A3'],
+            'top_decades': [1980, 2000, 1990],
+            'top_genres': ['Rock', 'Folk', 'Jazz'],
+        }
+
+    def test_ranked_statement_excludes_other_categories(self, file_db):
+        """测试窗口函数查询只返回三个统计维度，按维度、名次排序"""
+        import database.db as db
+
+        with file_db() as session:
+            rows = session.execute(db._TOP_PREFERENCES).all()
+
+        assert [tuple(row) for row in rows] == [
+            ('artist', 'A2'), ('artist', 'A6'), ('artist', 'A4'), ('artist', 'A7'), ('artist', 'A3'),
+            ('decade', '1980'), ('decade', '2000'), ('decade', '1990'),
+            ('genre', 'Rock'), ('genre', 'Folk'), ('genre', 'Jazz'),
+        ]
+
+
+class TestRecommendations:
+    """推荐打分测试类（使用临时数据库文件）"""
+
+    PREFS = {'top_artists': ['Fav'], 'top_decades': [1980], 'top_genres': ['Rock']}
+
+    @pytest.fixture(autouse=True)
+    def library(self, file_db):
+        """写入命中不同偏好组合的歌曲"""
+        import database.db as db
+
+        rows = [
+            ('best', 'Fav', 1985, 'Rock'),      # 3 + 2 + 1
+            ('artist', 'Fav', 2010, 'Jazz'),    # 3
+            ('decade', 'Other', 1982, 'Rock'),  # 2 + 1
+            ('genre', 'Other', 1999, 'Rock'),   # 1
+        ] + [(f'none{i}', 'Nobody', 1960, 'Classical') for i in range(4)]
+        db.add_music_bulk([
+            {'file_path': f'/music/{title}.mp3', 'title': title, 'artist': artist, 'year': year, 'genre': genre}
+            for title, artist, year, genre in rows
+        ])
+        return file_db
+
+    def test_matching_tracks_rank_first(self):
+        """测试按偏好打分排序，同分的歌曲排在一起"""
+        import database.db as db
+
+        titles = [t.title for t in db.get_recommended_tracks(limit=4, prefs=self.PREFS)]
+
+        assert titles[0] == 'best'
+        assert set(titles[1:3]) == {'artist', 'decade'}
+        assert titles[3] == 'genre'
+
+    def test_fills_with_random_tracks(self):
+        """测试命中偏好的歌曲不足时用其余歌曲补足，且不重复"""
+        import database.db as db
+
+        titles = [t.title for t in db.get_recommended_tracks(limit=6, prefs=self.PREFS)]
+
+        assert len(titles) == 6
+        assert len(set(titles)) == 6
+        assert titles[0] == 'best'
+        assert set(titles[4:]) <= {f'none{i}' for i in range(4)}
+
+    def test_preferences_from_play_history(self, library):
+        """测试不传 prefs 时在 SQL 中统计偏好并打分"""
+        import database.db as db
+        from database.models import UserPreference
+
+        with library() as session:
+            session.add_all([
+                UserPreference(category='artist', value='Fav', play_count=5),
+                UserPreference(category='decade', value='1980', play_count=5),
+                UserPreference(category='genre', value='Rock', play_count=5),
+            ])
+            session.commit()
+
+        assert [t.title for t in db.get_recommended_tracks(limit=1)] == ['best']
+
+    def test_no_preferences_is_random(self):
+        """测试没有偏好记录时随机推荐"""
+        import database.db as db
+
+        tracks = db.get_recommended_tracks(limit=3)
+
+        assert len(tracks) == 3
+        assert len({t.id for t in tracks}) == 3
+
+
+class TestPlayQueue:
+    """后台写入播放记录测试类（使用临时数据库文件）"""
+
+    @pytest.fixture(autouse=True)
+    def music_ids(self, file_db, monkeypatch):
+        """写入两首歌曲并缩短凑批等待时间，返回 (歌曲 ID 列表, 会话工厂)"""
+        import database.db as db
+        from database.models import Music
+
+        monkeypatch.setattr(db, '_PLAY_BATCH_WINDOW', 0.1)
+        db.add_music_bulk([
+            {'file_path': '/music/a.mp3', 'title': 'A', 'artist': 'Artist A', 'genre': 'Pop', 'year': 2004},
+            {'file_path': '/music/b.mp3', 'title': 'B', 'artist': 'Artist B', 'genre': 'Rock', 'year': 1995},
+        ])
+        with file_db() as session:
+            ids = list(session.scalars(select(Music.id).order_by(Music.file_path)))
+        return ids, file_db
+
+    def _counts(self, Session):
+        """返回 (播放历史条数, {(维度, 值): 播放次数})"""
+        from sqlalchemy import func
+        from database.models import PlayHistory, UserPreference
+
+        with Session() as session:
+            history = session.scalar(select(func.count()).select_from(PlayHistory))
+            prefs = {
+                (category, value): count for category, value, count in session.execute(
+                    select(UserPreference.category, UserPreference.value, UserPreference.play_count)
+                )
+            }
+        return history, prefs
+
+    def test_queue_and_flush(self, music_ids, monkeypatch):
+        """测试排队的播放记录在同一个事务中写入，并使偏好缓存失效"""
+        import database.db as db
+
+        (a, b), Session = music_ids
+        sessions = []
+
+        def counting_session():
+            sessions.append(1)
+            return Session()
+
+        monkeypatch.setattr(db, 'get_session', counting_session)
+        version = db._prefs_version
+
+        db.queue_plays([a, a, b])
+        db.flush_plays()
+
+        history, prefs = self._counts(Session)
+        assert history == 3
+        assert prefs[('artist', 'Artist A')] == 2
+        assert prefs[('artist', 'Artist B')] == 1
+        assert prefs[('decade', '2000')] == 2
+        # 三条播放在一个批次中写入
+        assert len(sessions) == 1
+        assert db._prefs_version > version
+
+    def test_failed_batch_rolls_back(self, music_ids, monkeypatch, caplog, capsys):
+        """测试批次写入出错时整批回滚，写入线程继续处理后续记录"""
+        import database.db as db
+
+        (a, b), Session = music_ids
+        record_play = db._record_play
+
+        def failing_record_play(session, music_id, completion_rate):
+            if music_id == b:
+                raise RuntimeError("boom")
+            record_play(session, music_id, completion_rate)
+
+        monkeypatch.setattr(db, '_record_play', failing_record_play)
+
+        with caplog.at_level(logging.ERROR):
+            db.queue_plays([a, b])
+            db.flush_plays()
+
+        assert self._counts(Session) == (0, {})
+        errors = [r for r in caplog.records if r.message == "Error recording plays"]
+        assert len(errors) == 1
+        assert errors[0].exc_info[0] is RuntimeError
+        assert capsys.readouterr().out == ""
+
+        db.queue_plays([a])
+        db.flush_plays()
+
+        assert db._play_writer.is_alive()
+        history, prefs = self._counts(Session)
+        assert history == 1
+        assert prefs[('artist', 'Artist A')] == 1
+
+
 class TestMusicModel:
     """Music 模型测试类"""
 
@@ -135,20 +633,23 @@ class TestMusicModel:
 class TestDatabaseConnection:
     """数据库连接测试类"""
 
-    def test_database_exists(self):
-        """测试数据库文件存在"""
-        assert os.path.exists(TEST_DB_PATH), f"数据库文件不存在: {TEST_DB_PATH}"
+    def test_database_has_tables(self, db_engine):
+        """测试测试数据库已创建所有表"""
+        from sqlalchemy import inspect
+        tables = inspect(db_engine).get_table_names()
+        for name in ['music', 'play_history', 'user_preference']:
+            assert name in tables
 
-    def test_database_has_music_table(self):
+    def test_database_has_music_table(self, db_session):
         """测试音乐表存在"""
         import database.db as db
         all_music = db.get_all_music()
         assert isinstance(all_music, list)
 
-    def test_get_session_works(self):
+    def test_get_session_works(self, db_session):
         """测试获取会话正常工作"""
-        from database.models import get_session
-        session = get_session()
+        import database.db as db
+        session = db.get_session()
         try:
             count = session.query(Music).count()
             assert count >= 0
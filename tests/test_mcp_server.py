@@ -3,18 +3,28 @@
 MCP 服务器单元测试
 
 测试 ai_music_player/__main__.py 中的 MCP 工具函数
-使用实际项目数据库进行测试
+数据库相关测试使用内存数据库（见 conftest.py）
 """
 
-import os
-import sys
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import MagicMock, Mock
 
-# 添加项目根目录和 ai_music_player 目录到路径
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, project_root)
-sys.path.insert(0, os.path.join(project_root, 'ai_music_player'))
+
+@pytest.fixture
+def server_player(monkeypatch):
+    """
+    创建 MCP 服务器自带的 MusicPlayer，pygame.mixer 替换为模拟对象
+
+    不会初始化真实的音频设备，也不会启动后台线程
+    """
+    import pygame
+    import ai_music_player.__main__ as mcp_server
+
+    mixer = MagicMock(spec=pygame.mixer)
+    mixer.music = MagicMock(spec=pygame.mixer.music)
+    monkeypatch.setattr(pygame, 'mixer', mixer)
+    monkeypatch.setattr(mcp_server.MusicPlayer, '_start_monitor', lambda self: None)
+    return mcp_server.MusicPlayer()
 
 
 class TestMCPConfig:
@@ -29,104 +39,129 @@ class TestMCPConfig:
 class TestControlFunctions:
     """控制功能测试类"""
 
-    def test_pause_function(self):
-        """测试暂停函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.pause.return_value = True
-            mock_get.return_value = player
+    @pytest.mark.parametrize("name, expected", [
+        ("pause", "已暂停"),
+        ("resume", "继续播放"),
+        ("stop", "已停止"),
+    ])
+    def test_control_function(self, player_mock, name, expected):
+        """测试暂停/继续播放/停止函数"""
+        import ai_music_player.__main__ as mcp_server
 
-            from ai_music_player.__main__ import pause
-            result = pause()
+        getattr(player_mock, name).return_value = True
 
-            assert result == "已暂停"
-            player.pause.assert_called_once()
+        result = getattr(mcp_server, name)()
 
-    def test_resume_function(self):
-        """测试继续播放函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.resume.return_value = True
-            mock_get.return_value = player
+        assert result == expected
+        getattr(player_mock, name).assert_called_once()
 
-            from ai_music_player.__main__ import resume
-            result = resume()
+    @pytest.mark.parametrize("track_name, expected", [
+        ("Next Song", "正在播放: Next Song"),
+        (None, "播放下一首"),
+    ])
+    def test_next_track_function(self, player_mock, track_name, expected):
+        """测试下一首函数（有/无当前曲目名）"""
+        player_mock.next.return_value = True
+        player_mock.get_status.return_value = {
+            'current_track_name': track_name
+        }
 
-            assert result == "继续播放"
-            player.resume.assert_called_once()
+        from ai_music_player.__main__ import next_track
+        result = next_track()
 
-    def test_stop_function(self):
-        """测试停止函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.stop.return_value = True
-            mock_get.return_value = player
+        assert result == expected
 
-            from ai_music_player.__main__ import stop
-            result = stop()
+    def test_get_player_status_function(self, player_mock):
+        """测试获取播放状态函数"""
+        player_mock.get_detailed_status.return_value = {
+            'is_playing': True,
+            'is_paused': False,
+            'is_busy': True,
+            'current_track': None,
+            'volume': 70,
+            'playlist_size': 3,
+            'current_index': 1
+        }
 
-            assert result == "已停止"
-            player.stop.assert_called_once()
+        from ai_music_player.__main__ import get_player_status
+        result = get_player_status()
 
-    def test_next_track_function(self):
-        """测试下一首函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.next.return_value = True
-            player.get_status.return_value = {
-                'current_track_name': 'Next Song'
-            }
-            mock_get.return_value = player
+        assert result['volume'] == 70
+        assert result['current_index'] == 2
+        player_mock.get_detailed_status.assert_called_once()
 
-            from ai_music_player.__main__ import next_track
-            result = next_track()
 
-            assert "下一首" in result or "正在播放" in result
+class TestPlayFunctions:
+    """播放功能测试类"""
 
+    def test_play_artist_uses_playlist_rows(self, player_mock, monkeypatch):
+        """测试按歌手播放使用轻量记录查询"""
+        import ai_music_player.__main__ as mcp_server
 
-class TestVolumeFunctions:
-    """音量控制测试类"""
+        player_mock.shuffle_play.return_value = True
+        player_mock.get_status.return_value = {'current_track_name': 'Song'}
+        mock_db = MagicMock()
+        mock_db.get_music_rows.return_value = [Mock(id=1), Mock(id=2)]
+        monkeypatch.setattr(mcp_server, 'database_db', mock_db)
+
+        result = mcp_server.play_artist("周杰伦")
+
+        assert "共 2 首" in result
+        mock_db.get_music_rows.assert_called_once_with(artist="周杰伦")
+        player_mock.set_playlist.assert_called_once()
+        mock_db.queue_plays.assert_called_once_with([1, 2])
+
+    def test_play_decade_uses_playlist_rows(self, player_mock, monkeypatch):
+        """测试按年代播放使用轻量记录查询，年份区间为整个年代"""
+        import ai_music_player.__main__ as mcp_server
+
+        player_mock.shuffle_play.return_value = True
+        mock_db = MagicMock()
+        mock_db.get_music_rows.return_value = [Mock(id=1), Mock(id=2), Mock(id=3)]
+        monkeypatch.setattr(mcp_server, 'database_db', mock_db)
+
+        result = mcp_server.play_decade(1990)
 
-    def test_volume_up_function(self):
-        """测试音量增加函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.volume_up.return_value = 0.8
-            mock_get.return_value = player
+        assert "共 3 首" in result
+        mock_db.get_music_rows.assert_called_once_with(year_range=(1990, 1999))
+        mock_db.get_music_by_year_range.assert_not_called()
+        player_mock.shuffle_play.assert_called_once()
 
-            from ai_music_player.__main__ import volume_up
-            result = volume_up()
 
-            assert "80%" in result
-            player.volume_up.assert_called_once()
+class TestVolumeFunctions:
+    """音量控制测试类"""
 
-    def test_volume_down_function(self):
-        """测试音量降低函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.volume_down.return_value = 0.6
-            mock_get.return_value = player
+    @pytest.mark.parametrize("name, args, percent, expected", [
+        ("volume_up", (), 80, "80%"),
+        ("volume_down", (), 60, "60%"),
+        ("set_volume", (0.5,), 50, "50%"),
+    ])
+    def test_volume_function(self, player_mock, name, args, percent, expected):
+        """测试音量增加/降低/设置函数"""
+        import ai_music_player.__main__ as mcp_server
 
-            from ai_music_player.__main__ import volume_down
-            result = volume_down()
+        player_mock.volume_percent = percent
 
-            assert "60%" in result
-            player.volume_down.assert_called_once()
+        result = getattr(mcp_server, name)(*args)
 
-    def test_set_volume_function(self):
-        """测试设置音量函数"""
-        with patch('ai_music_player.__main__.get_player') as mock_get:
-            player = MagicMock()
-            player.set_volume.return_value = 0.5
-            mock_get.return_value = player
+        assert expected in result
+        getattr(player_mock, name).assert_called_once_with(*args)
 
-            from ai_music_player.__main__ import set_volume
-            result = set_volume(0.5)
+    @pytest.mark.parametrize("volume", [0.29, 0.57, 0.58])
+    def test_volume_percent_not_truncated(self, server_player, monkeypatch, volume):
+        """测试工具显示的音量百分比与设置值一致（int(0.29 * 100) 会得到 28）"""
+        import ai_music_player.__main__ as mcp_server
 
-            assert "50%" in result
-            player.set_volume.assert_called_once_with(0.5)
+        monkeypatch.setattr(mcp_server, "get_player", lambda: server_player)
+        expected = round(volume * 100)
 
+        assert mcp_server.set_volume(volume) == f"音量: {expected}%"
+        assert mcp_server.get_player_status()['volume'] == expected
+        assert mcp_server.volume_up() == f"音量: {expected + 10}%"
+        assert mcp_server.volume_down() == f"音量: {expected}%"
 
+
+@pytest.mark.usefixtures("db_session")
 class TestDatabaseFunctions:
     """数据库功能测试类（使用 db 模块）"""
 
@@ -148,19 +183,139 @@ class TestMCPFunctions:
 
     def test_tools_exist(self):
         """测试主要 MCP 工具函数都存在"""
-        from ai_music_player.__main__ import (
-            play_artist, play_song, play_genre,
-            play_album, play_random, smart_recommend, pause, resume, stop,
-            next_track, previous_track, volume_up, volume_down,
-            set_volume, get_player_status,
-            list_artists, list_genres, search_songs,
-            scan_music_library, seek_to
-        )
-        assert callable(play_artist)
-        assert callable(pause)
-        assert callable(stop)
+        import ai_music_player.__main__ as mcp_server
+
+        for name in (
+            'play_artist', 'play_song', 'play_genre',
+            'play_album', 'play_random', 'smart_recommend', 'pause', 'resume', 'stop',
+            'next_track', 'previous_track', 'volume_up', 'volume_down',
+            'set_volume', 'get_player_status',
+            'list_artists', 'list_genres', 'search_songs',
+            'scan_music_library', 'seek_to'
+        ):
+            assert callable(getattr(mcp_server, name)), name
 
     def test_mcp_decorator_works(self):
         """测试 MCP 装饰器正常工作"""
         import ai_music_player.__main__ as mcp_server
         assert hasattr(mcp_server, 'mcp')
+
+
+class TestServerMusicPlayer:
+    """MCP 服务器播放器测试类"""
+
+    def test_poll_detects_track_end(self, server_player, monkeypatch):
+        """测试轮询线程在播放从进行中变为停止时置位结束信号"""
+        import time
+        import ai_music_player.__main__ as mcp_server
+
+        class _Stop(Exception):
+            pass
+
+        busy_states = iter([True, False])
+        server_player._get_busy = lambda: next(busy_states)
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 2:
+                raise _Stop
+
+        monkeypatch.setattr(time, 'sleep', fake_sleep)
+
+        with pytest.raises(_Stop):
+            server_player._poll_track_end()
+
+        assert server_player._track_end.is_set()
+        assert sleeps == [mcp_server._END_POLL_INTERVAL] * 2
+
+    def test_playback_does_not_register_end_event(self, server_player):
+        """测试播放和切歌不再注册 pygame 结束事件（歌曲结束只由轮询线程检测）"""
+        import pygame
+
+        server_player.set_playlist([Mock(file_path=f'/song{i}.mp3') for i in range(3)])
+
+        assert server_player.play_all()
+        assert server_player.next()
+        assert server_player.previous()
+        assert server_player.shuffle_play()
+
+        assert pygame.mixer.music.play.call_count == 4
+        pygame.mixer.music.set_endevent.assert_not_called()
+        assert not hasattr(server_player, '_check_and_play_next')
+
+    def test_play_track_sets_current_track_via_load(self, server_player):
+        """测试 play_track 由 load() 记录当前歌曲路径和文件名；加载失败时保持不变"""
+        import pygame
+
+        assert server_player.play_track(Mock(file_path='/music/七里香.mp3'))
+        assert server_player.current_track == '/music/七里香.mp3'
+        assert server_player.get_status()['current_track_name'] == '七里香'
+
+        pygame.mixer.music.load.side_effect = pygame.error("bad file")
+        assert server_player.play_track(Mock(file_path='/music/broken.mp3')) is False
+        assert server_player.current_track == '/music/七里香.mp3'
+        assert server_player.get_status()['current_track_name'] == '七里香'
+
+    def test_monitor_logs_advance_error(self, server_player, monkeypatch, caplog, capsys):
+        """测试自动切歌出错时写入日志（含调用栈）而不是 stdout，且线程不退出"""
+        import logging
+
+        class _Stop(Exception):
+            pass
+
+        waits = []
+
+        def fake_wait():
+            waits.append(1)
+            if len(waits) > 2:
+                raise _Stop
+
+        def fail():
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(server_player._track_end, 'wait', fake_wait)
+        server_player._get_busy = lambda: False
+        server_player.playlist = [Mock(file_path='/a.mp3'), Mock(file_path='/b.mp3')]
+        server_player.is_playing = True
+        server_player.play_current = fail
+
+        with caplog.at_level(logging.ERROR), pytest.raises(_Stop):
+            server_player._monitor_playback()
+
+        # 两次结束信号都被处理，第一次出错后线程仍在运行
+        errors = [r for r in caplog.records if r.message == "Error advancing track"]
+        assert len(errors) == 2
+        assert errors[0].exc_info[0] is RuntimeError
+        assert capsys.readouterr().out == ""
+
+    def test_shuffle_previous_returns_to_played_tracks(self, server_player, monkeypatch):
+        """测试随机播放时"上一首"按实际播放顺序回退，而不是列表中的相邻歌曲"""
+        monkeypatch.setattr(server_player, 'play_current', lambda: True)
+        server_player.set_playlist([Mock(file_path=f'/song{i}.mp3') for i in range(10)])
+
+        server_player.shuffle_play()
+        played = [server_player.current_index]
+        for _ in range(4):
+            server_player.next()
+            played.append(server_player.current_index)
+
+        backtracked = [server_player.current_index]
+        for _ in range(4):
+            server_player.previous()
+            backtracked.append(server_player.current_index)
+
+        assert backtracked == played[::-1]
+
+    def test_previous_in_order_plays_neighbour(self, server_player, monkeypatch):
+        """测试顺序播放时"上一首"为列表中的前一首（循环）"""
+        monkeypatch.setattr(server_player, 'play_current', lambda: True)
+        server_player.set_playlist([Mock(file_path=f'/song{i}.mp3') for i in range(3)])
+
+        server_player.play_all()
+        server_player.previous()
+        assert server_player.current_index == 2
+
+        server_player.next()
+        server_player.previous()
+        assert server_player.current_index == 2
@@ -5,62 +5,53 @@
 测试 ai_music_player/database/models.py 中的模型定义
 """
 
-import os
-import sys
-import tempfile
-
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-# 添加项目根目录和 ai_music_player 目录到路径
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.insert(0, project_root)
-sys.path.insert(0, os.path.join(project_root, 'ai_music_player'))
-
-from ai_music_player.database.models import Base, Music, PlayHistory, UserPreference
 
 
 class TestMusicModel:
     """Music 模型测试类"""
 
-    @pytest.fixture
-    def engine(self):
-        """创建内存数据库引擎"""
-        engine = create_engine("sqlite:///:memory:")
-        Base.metadata.create_all(engine)
-        return engine
-
-    @pytest.fixture
-    def session(self, engine):
-        """创建数据库会话"""
-        Session = sessionmaker(bind=engine)
-        return Session()
-
     def test_music_table_name(self):
         """测试 Music 表名"""
+        from ai_music_player.database.models import Music
+
         assert Music.__tablename__ == "music"
 
     def test_music_columns(self):
         """测试 Music 模型列定义"""
+        from ai_music_player.database.models import Music
+
         columns = [c.name for c in Music.__table__.columns]
         expected_columns = ['id', 'file_path', 'title', 'artist', 'album',
-                           'year', 'genre', 'duration', 'format', 'created_at']
+                           'year', 'genre', 'duration', 'format', 'mtime', 'created_at']
         for col in expected_columns:
             assert col in columns
 
     def test_music_file_path_unique(self):
         """测试 file_path 是否有唯一约束"""
+        from ai_music_player.database.models import Music
+
         file_path_column = Music.__table__.columns['file_path']
         assert file_path_column.unique is True
 
     def test_music_file_path_not_nullable(self):
         """测试 file_path 是否为必填"""
+        from ai_music_player.database.models import Music
+
         file_path_column = Music.__table__.columns['file_path']
         assert not file_path_column.nullable
 
+    def test_music_metadata_indexed(self):
+        """测试 artist/album/genre/year 是否建有索引"""
+        from ai_music_player.database.models import Music
+
+        for name in ['artist', 'album', 'genre', 'year']:
+            assert Music.__table__.columns[name].index is True
+
     def test_music_repr(self):
         """测试 Music 字符串表示"""
+        from ai_music_player.database.models import Music
+
         music = Music(id=1, title="Test Song", artist="Test Artist")
         repr_str = repr(music)
         assert "Music" in repr_str
@@ -69,6 +60,8 @@ class TestMusicModel:
 
     def test_music_create_and_query(self, session):
         """测试 Music 创建和查询"""
+        from ai_music_player.database.models import Music
+
         music = Music(
             file_path="/path/to/song.mp3",
             title="Test Song",
@@ -93,25 +86,16 @@ class TestMusicModel:
 class TestPlayHistoryModel:
     """PlayHistory 模型测试类"""
 
-    @pytest.fixture
-    def engine(self):
-        """创建内存数据库引擎"""
-        engine = create_engine("sqlite:///:memory:")
-        Base.metadata.create_all(engine)
-        return engine
-
-    @pytest.fixture
-    def session(self, engine):
-        """创建数据库会话"""
-        Session = sessionmaker(bind=engine)
-        return Session()
-
     def test_play_history_table_name(self):
         """测试 PlayHistory 表名"""
+        from ai_music_player.database.models import PlayHistory
+
         assert PlayHistory.__tablename__ == "play_history"
 
     def test_play_history_columns(self):
         """测试 PlayHistory 模型列定义"""
+        from ai_music_player.database.models import PlayHistory
+
         columns = [c.name for c in PlayHistory.__table__.columns]
         expected_columns = ['id', 'music_id', 'played_at', 'completion_rate']
         for col in expected_columns:
@@ -119,6 +103,8 @@ class TestPlayHistoryModel:
 
     def test_play_history_repr(self):
         """测试 PlayHistory 字符串表示"""
+        from ai_music_player.database.models import PlayHistory
+
         history = PlayHistory(id=1, music_id=10)
         repr_str = repr(history)
         assert "PlayHistory" in repr_str
@@ -126,6 +112,8 @@ class TestPlayHistoryModel:
 
     def test_play_history_create(self, session):
         """测试 PlayHistory 创建"""
+        from ai_music_player.database.models import PlayHistory
+
         history = PlayHistory(music_id=1, completion_rate=0.8)
         session.add(history)
         session.commit()
@@ -136,6 +124,8 @@ class TestPlayHistoryModel:
 
     def test_play_history_default_completion_rate(self, session):
         """测试 completion_rate 默认值"""
+        from ai_music_player.database.models import PlayHistory
+
         history = PlayHistory(music_id=1)
         session.add(history)
         session.commit()
@@ -147,88 +137,165 @@ class TestPlayHistoryModel:
 class TestUserPreferenceModel:
     """UserPreference 模型测试类"""
 
-    @pytest.fixture
-    def engine(self):
-        """创建内存数据库引擎"""
-        engine = create_engine("sqlite:///:memory:")
-        Base.metadata.create_all(engine)
-        return engine
-
-    @pytest.fixture
-    def session(self, engine):
-        """创建数据库会话"""
-        Session = sessionmaker(bind=engine)
-        return Session()
-
     def test_user_preference_table_name(self):
         """测试 UserPreference 表名"""
+        from ai_music_player.database.models import UserPreference
+
         assert UserPreference.__tablename__ == "user_preference"
 
     def test_user_preference_columns(self):
         """测试 UserPreference 模型列定义"""
+        from ai_music_player.database.models import UserPreference
+
         columns = [c.name for c in UserPreference.__table__.columns]
-        expected_columns = ['id', 'artist', 'album', 'genre', 'decade',
-                           'play_count', 'last_played']
+        expected_columns = ['id', 'category', 'value', 'play_count', 'last_played']
         for col in expected_columns:
             assert col in columns
 
     def test_user_preference_repr(self):
         """测试 UserPreference 字符串表示"""
-        pref = UserPreference(artist="Test Artist", genre="Rock", play_count=5)
+        from ai_music_player.database.models import UserPreference
+
+        pref = UserPreference(category="artist", value="Test Artist", play_count=5)
         repr_str = repr(pref)
         assert "UserPreference" in repr_str
         assert "Test Artist" in repr_str
 
     def test_user_preference_create(self, session):
         """测试 UserPreference 创建"""
+        from ai_music_player.database.models import UserPreference
+
         pref = UserPreference(
-            artist="周杰伦",
-            genre="流行",
+            category="artist",
+            value="周杰伦",
             play_count=10
         )
         session.add(pref)
         session.commit()
 
         result = session.query(UserPreference).first()
-        assert result.artist == "周杰伦"
-        assert result.genre == "流行"
+        assert result.category == "artist"
+        assert result.value == "周杰伦"
         assert result.play_count == 10
 
     def test_user_preference_default_play_count(self, session):
         """测试 play_count 默认值"""
-        pref = UserPreference(artist="Test")
+        from ai_music_player.database.models import UserPreference
+
+        pref = UserPreference(category="genre", value="Test")
         session.add(pref)
         session.commit()
 
         result = session.query(UserPreference).first()
         assert result.play_count == 0
 
+    def test_user_preference_category_count_index(self):
+        """测试 (category, play_count DESC) 复合索引"""
+        from ai_music_player.database.models import UserPreference
+
+        indexes = {index.name: index for index in UserPreference.__table__.indexes}
+        assert 'ix_pref_category_count' in indexes
+        sql = str(indexes['ix_pref_category_count'].expressions[1])
+        assert sql.endswith('DESC')
+
+    def test_user_preference_category_value_unique(self, session):
+        """测试同一维度的同一值只能有一条记录"""
+        from ai_music_player.database.models import UserPreference
+
+        from sqlalchemy.exc import IntegrityError
+
+        session.add(UserPreference(category="artist", value="Same"))
+        session.add(UserPreference(category="genre", value="Same"))
+        session.commit()
+
+        session.add(UserPreference(category="artist", value="Same"))
+        with pytest.raises(IntegrityError):
+            session.commit()
+
 
 class TestDatabaseInit:
     """数据库初始化测试类"""
 
     def test_init_db_creates_tables(self):
         """测试 init_db 是否创建表"""
-        import tempfile
+        from sqlalchemy import create_engine, inspect
         from database import models
 
-        # 使用临时数据库
-        with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as f:
-            db_path = f.name
-
-        try:
-            # 修改数据库路径
-            engine = create_engine(f"sqlite:///{db_path}")
-
-            # 调用 init_db
-            models.Base.metadata.create_all(engine)
+        # 使用内存数据库
+        engine = create_engine("sqlite:///:memory:")
 
-            # 验证表已创建
-            assert 'music' in models.Base.metadata.tables
-            assert 'play_history' in models.Base.metadata.tables
-            assert 'user_preference' in models.Base.metadata.tables
-        finally:
-            os.unlink(db_path)
+        # 调用 init_db
+        models.Base.metadata.create_all(engine)
+
+        # 验证表已创建
+        tables = inspect(engine).get_table_names()
+        assert 'music' in tables
+        assert 'play_history' in tables
+        assert 'user_preference' in tables
+
+    def test_init_db_rebuilds_legacy_user_preference(self, file_engine):
+        """测试旧版（每个维度一列）的偏好表被重建，并从播放历史恢复偏好统计"""
+        from sqlalchemy import inspect, select, text
+        from sqlalchemy.orm import Session
+        from database.models import Base, Music, PlayHistory, UserPreference, init_db
+
+        Base.metadata.create_all(file_engine, tables=[Music.__table__, PlayHistory.__table__])
+        with file_engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE user_preference ("
+                "id INTEGER PRIMARY KEY, artist VARCHAR(255), album VARCHAR(255), "
+                "genre VARCHAR(100), decade INTEGER, play_count INTEGER, last_played DATETIME)"
+            ))
+            conn.execute(text(
+                "INSERT INTO user_preference (artist, play_count) VALUES ('Old Row', 99)"
+            ))
+
+        with Session(file_engine) as session:
+            qilixiang = Music(file_path="/music/qilixiang.mp3", artist="周杰伦", album="七里香", genre="Pop", year=2004)
+            daoxiang = Music(file_path="/music/daoxiang.mp3", artist="周杰伦", album="魔杰座", genre="Pop", year=2008)
+            hotel = Music(file_path="/music/hotel.mp3", artist="Eagles", album="", genre="Rock", year=1976)
+            session.add_all([qilixiang, daoxiang, hotel])
+            session.flush()
+            session.add_all(PlayHistory(music_id=m.id) for m in (qilixiang, qilixiang, daoxiang, hotel))
+            session.commit()
+
+        init_db()
+
+        inspector = inspect(file_engine)
+        columns = {c['name'] for c in inspector.get_columns('user_preference')}
+        assert {'category', 'value'} <= columns
+        assert 'artist' not in columns
+        index_names = {index['name'] for index in inspector.get_indexes('user_preference')}
+        assert 'ix_pref_category_count' in index_names
+        assert 'ix_pref_cat_count' not in index_names
+
+        with Session(file_engine) as session:
+            rows = set(session.execute(
+                select(UserPreference.category, UserPreference.value, UserPreference.play_count)
+            ))
+        assert rows == {
+            ('artist', '周杰伦', 3), ('artist', 'Eagles', 1),
+            ('album', '七里香', 2), ('album', '魔杰座', 1),
+            ('genre', 'Pop', 3), ('genre', 'Rock', 1),
+            ('decade', '2000', 3), ('decade', '1970', 1),
+        }
+
+    def test_init_db_drops_ascending_preference_index(self, file_engine):
+        """测试 init_db 删除已被降序索引取代的 ix_pref_cat_count"""
+        from sqlalchemy import inspect, text
+        from database.models import Base, init_db
+
+        Base.metadata.create_all(file_engine)
+        with file_engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX ix_pref_cat_count ON user_preference (category, play_count)"
+            ))
+
+        init_db()
+
+        index_names = {index['name'] for index in inspect(file_engine).get_indexes('user_preference')}
+        assert 'ix_pref_cat_count' not in index_names
+        assert 'ix_pref_category_count' in index_names
 
     def test_get_session_returns_session(self):
         """测试 get_session 是否返回会话对象"""
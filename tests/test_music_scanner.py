@@ -6,7 +6,7 @@
 """
 
 import os
-import tempfile
+import shutil
 
 import pytest
 from unittest.mock import Mock, patch, MagicMock
@@ -15,7 +15,15 @@ from unittest.mock import Mock, patch, MagicMock
 class TestExtractMetadata:
     """元数据提取测试类"""
 
-    @patch('scanner.music_scanner.File')
+    @pytest.fixture
+    def mock_file(self, monkeypatch):
+        """替换 mutagen.File，测试中设置 return_value 模拟读取结果"""
+        from scanner import music_scanner
+
+        mock = MagicMock()
+        monkeypatch.setattr(music_scanner, 'File', mock)
+        return mock
+
     def test_extract_metadata_with_id3_tags(self, mock_file):
         """测试从带 ID3 标签的音频文件提取元数据"""
         from scanner import music_scanner
@@ -43,7 +51,6 @@ class TestExtractMetadata:
         assert result['duration'] == 180
         assert result['format'] == 'mp3'
 
-    @patch('scanner.music_scanner.File')
     def test_extract_metadata_no_tags(self, mock_file):
         """测试无 ID3 标签的音频文件"""
         from scanner import music_scanner
@@ -61,7 +68,6 @@ class TestExtractMetadata:
         assert result['duration'] == 200
         assert result['format'] == 'flac'
 
-    @patch('scanner.music_scanner.File')
     def test_extract_metadata_invalid_file(self, mock_file):
         """测试无效文件"""
         from scanner import music_scanner
@@ -72,7 +78,6 @@ class TestExtractMetadata:
 
         assert result is None
 
-    @patch('scanner.music_scanner.File')
     def test_extract_metadata_alternative_tag_keys(self, mock_file):
         """测试备选标签键名"""
         from scanner import music_scanner
@@ -93,7 +98,6 @@ class TestExtractMetadata:
         assert result['title'] == 'Alt Title'
         assert result['artist'] == 'Alt Artist'
 
-    @patch('scanner.music_scanner.File')
     def test_extract_metadata_year_extraction(self, mock_file):
         """测试年份提取（从复杂格式中提取）"""
         from scanner import music_scanner
@@ -111,31 +115,37 @@ class TestExtractMetadata:
         assert result['year'] == 2023
 
 
+@pytest.fixture(scope="session")
+def music_template(tmp_path_factory):
+    """创建音乐目录模板（整个测试会话只创建一次）"""
+    template = tmp_path_factory.mktemp("music_template")
+    # 空文件（模拟音频文件）和一个非音频文件
+    for name in ('song1.mp3', 'song2.flac', 'readme.txt'):
+        (template / name).touch()
+    return template
+
+
 class TestScanDirectory:
     """目录扫描测试类"""
 
     @pytest.fixture
-    def temp_music_dir(self):
-        """创建临时音乐目录"""
-        with tempfile.TemporaryDirectory() as tmpdir:
-            yield tmpdir
+    def temp_music_dir(self, tmp_path):
+        """创建空的临时音乐目录"""
+        return str(tmp_path)
+
+    @pytest.fixture
+    def music_files_dir(self, music_template, tmp_path):
+        """复制模板，得到包含测试文件的临时音乐目录"""
+        music_dir = tmp_path / "music"
+        shutil.copytree(music_template, music_dir)
+        return str(music_dir)
 
     @patch('scanner.music_scanner.extract_metadata')
     @patch('scanner.music_scanner.SUPPORTED_EXTENSIONS', ['.mp3', '.flac'])
-    def test_scan_directory_with_files(self, mock_extract, temp_music_dir):
+    def test_scan_directory_with_files(self, mock_extract, music_files_dir):
         """测试扫描包含音频文件的目录"""
         from scanner import music_scanner
 
-        # 创建测试文件
-        mp3_file = os.path.join(temp_music_dir, 'song1.mp3')
-        flac_file = os.path.join(temp_music_dir, 'song2.flac')
-        txt_file = os.path.join(temp_music_dir, 'readme.txt')
-
-        # 创建空文件（模拟音频文件）
-        open(mp3_file, 'w').close()
-        open(flac_file, 'w').close()
-        open(txt_file, 'w').close()
-
         # 模拟元数据提取返回值
         mock_extract.return_value = {
             'title': 'Test Song',
@@ -149,10 +159,75 @@ class TestScanDirectory:
 
         # 使用内存数据库
         with patch('scanner.music_scanner.db'):
-            count = music_scanner.scan_directory(temp_music_dir)
+            count = music_scanner.scan_directory(music_files_dir)
 
         # 应该只扫描 .mp3 和 .flac 文件
-        assert count >= 0
+        assert count == 2
+        assert mock_extract.call_count == 2
+
+    @patch('scanner.music_scanner.extract_metadata')
+    @patch('scanner.music_scanner.db')
+    def test_scan_directory_writes_in_batches(self, mock_db, mock_extract, temp_music_dir):
+        """测试扫描结果批量写入数据库"""
+        from scanner import music_scanner
+
+        for name in ('song1.mp3', 'song2.mp3', 'song3.mp3'):
+            open(os.path.join(temp_music_dir, name), 'w').close()
+        mock_extract.return_value = {
+            'title': None, 'artist': 'Test Artist', 'album': None,
+            'year': None, 'genre': None, 'duration': 180, 'format': 'mp3'
+        }
+
+        with patch('scanner.music_scanner._FLUSH_SIZE', 2):
+            count = music_scanner.scan_directory(temp_music_dir)
+
+        assert count == 3
+        # 2 条一批，共写入两次
+        assert mock_db.add_music_bulk.call_count == 2
+        rows = [row for call in mock_db.add_music_bulk.call_args_list for row in call.args[0]]
+        assert sorted(row['title'] for row in rows) == ['song1', 'song2', 'song3']
+        mock_db.add_music.assert_not_called()
+
+    @patch('scanner.music_scanner.extract_metadata')
+    @patch('scanner.music_scanner.db')
+    def test_scan_directory_skips_unchanged_files(self, mock_db, mock_extract, temp_music_dir):
+        """测试修改时间未变的文件不会重新提取元数据"""
+        from scanner import music_scanner
+
+        unchanged = os.path.join(temp_music_dir, 'old.mp3')
+        changed = os.path.join(temp_music_dir, 'new.mp3')
+        open(unchanged, 'w').close()
+        open(changed, 'w').close()
+        mock_db.get_file_mtimes.return_value = {
+            unchanged: os.stat(unchanged).st_mtime,
+            changed: 0.0
+        }
+        mock_extract.return_value = {
+            'title': 'Song', 'artist': None, 'album': None,
+            'year': None, 'genre': None, 'duration': 0, 'format': 'mp3'
+        }
+
+        count = music_scanner.scan_directory(temp_music_dir)
+
+        assert count == 1
+        mock_extract.assert_called_once_with(changed)
+        rows = mock_db.add_music_bulk.call_args.args[0]
+        assert rows[0]['mtime'] == os.stat(changed).st_mtime
+
+    @patch('scanner.music_scanner._MAX_WORKERS', 2)
+    @patch('scanner.music_scanner.db')
+    def test_scan_directory_parallel(self, mock_db, temp_music_dir):
+        """测试文件较多时使用进程池提取元数据"""
+        from scanner import music_scanner
+
+        # 空文件无法识别为音频，不会写入数据库
+        for i in range(music_scanner._PARALLEL_MIN_FILES):
+            open(os.path.join(temp_music_dir, f'song{i}.mp3'), 'w').close()
+
+        count = music_scanner.scan_directory(temp_music_dir)
+
+        assert count == 0
+        mock_db.add_music_bulk.assert_not_called()
 
     @patch('scanner.music_scanner.db')
     def test_scan_directory_nonexistent(self, mock_db):
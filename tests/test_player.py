@@ -5,190 +5,128 @@
 测试 player/player.py 中的播放器功能
 """
 
+from types import SimpleNamespace
+
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 
+from player.player import MusicPlayer
 
-class TestMusicPlayerInit:
-    """播放器初始化测试类"""
-
-    @patch('player.player.pygame.mixer')
-    def test_init_default_values(self, mock_mixer):
-        """测试初始化默认属性"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-
-        assert player.current_track is None
-        assert player.playlist == []
-        assert player.current_index == 0
-        assert player.is_playing is False
-        assert player.is_paused is False
-        # 音量应该是默认配置值
-        assert 0.0 <= player.volume <= 1.0
-
-    @patch('player.player.pygame.mixer')
-    def test_init_calls_mixer_init(self, mock_mixer):
-        """测试初始化调用 mixer.init()"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
 
-        mock_mixer.init.assert_called_once()
-
-    @patch('player.player.pygame.mixer')
-    def test_init_sets_volume(self, mock_mixer):
-        """测试初始化设置音量"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-
-        mock_mixer.music.set_volume.assert_called_once()
+@pytest.fixture(autouse=True)
+def mock_mixer(monkeypatch):
+    """
+    替换 pygame.mixer，播放器创建时取到的就是这个模拟对象
 
+    本模块所有测试自动使用，任何测试都不会初始化真实的音频设备
+    以真实的 pygame.mixer / pygame.mixer.music 为 spec：访问不存在的方法时直接报错
+    """
+    import pygame
 
-class TestMusicPlayerLoad:
-    """音乐加载测试类"""
+    mixer = MagicMock(spec=pygame.mixer)
+    mixer.music = MagicMock(spec=pygame.mixer.music)
+    monkeypatch.setattr(pygame, 'mixer', mixer)
+    return mixer
 
-    @patch('player.player.pygame.mixer')
-    def test_load_success(self, mock_mixer):
-        """测试加载成功"""
-        from player.player import MusicPlayer
 
-        player = MusicPlayer()
-        result = player.load('/path/to/song.mp3')
+@pytest.fixture
+def skip_playback(monkeypatch):
+    """让 play_current 直接返回成功，只测试索引切换逻辑（实例有 __slots__，需替换类属性）"""
+    monkeypatch.setattr(MusicPlayer, 'play_current', lambda self: True)
 
-        assert result is True
-        assert player.current_track == '/path/to/song.mp3'
-        mock_mixer.music.load.assert_called_once_with('/path/to/song.mp3')
-
-    @patch('player.player.pygame.mixer')
-    def test_load_failure(self, mock_mixer):
-        """测试加载失败"""
-        from player.player import MusicPlayer
 
-        mock_mixer.music.load.side_effect = Exception("File not found")
+@pytest.fixture(scope="module")
+def tracks():
+    """播放列表用的曲目对象（只需要 file_path 属性，整个模块共用，测试中不要修改）"""
+    return [SimpleNamespace(file_path=f'/path/song{i}.mp3') for i in range(5)]
 
-        player = MusicPlayer()
-        result = player.load('/path/to/invalid.mp3')
-
-        assert result is False
 
+@pytest.fixture
+def player(mock_mixer):
+    """创建使用模拟 mixer 的播放器"""
+    return MusicPlayer()
 
-class TestMusicPlayerPlay:
-    """播放功能测试类"""
 
-    @patch('player.player.pygame.mixer')
-    def test_play_success(self, mock_mixer):
-        """测试播放成功"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        result = player.play()
+class TestMusicPlayerInit:
+    """播放器初始化测试类"""
 
-        assert result is True
-        assert player.is_playing is True
+    def test_init(self, player, mock_mixer):
+        """测试初始化默认属性、调用 mixer.init() 并设置音量"""
+        assert player.current_track is None
+        assert player.playlist == []
+        assert player.current_index == 0
+        assert player.is_playing is False
         assert player.is_paused is False
-        mock_mixer.music.play.assert_called_once()
-
-    @patch('player.player.pygame.mixer')
-    def test_play_failure(self, mock_mixer):
-        """测试播放失败"""
-        from player.player import MusicPlayer
-
-        mock_mixer.music.play.side_effect = Exception("No file loaded")
-
-        player = MusicPlayer()
-        result = player.play()
-
-        assert result is False
-
+        # 音量应该是默认配置值
+        assert 0.0 <= player.volume <= 1.0
 
-class TestMusicPlayerPause:
-    """暂停功能测试类"""
+        mock_mixer.init.assert_called_once()
+        mock_mixer.music.set_volume.assert_called_once_with(player.volume)
 
-    @patch('player.player.pygame.mixer')
-    def test_pause_success(self, mock_mixer):
-        """测试暂停成功"""
-        from player.player import MusicPlayer
+    def test_module_does_not_import_pygame(self):
+        """测试模块顶层不导入 pygame（创建播放器时才导入）"""
+        from player import player as player_module
 
-        player = MusicPlayer()
-        result = player.pause()
+        assert not hasattr(player_module, 'pygame')
 
-        assert result is True
-        assert player.is_paused is True
-        mock_mixer.music.pause.assert_called_once()
+    def test_volume_steps_do_not_drift(self, player):
+        """测试反复增减音量后仍是精确的 10% 刻度"""
+        player.set_volume(0.0)
 
-    @patch('player.player.pygame.mixer')
-    def test_pause_failure(self, mock_mixer):
-        """测试暂停失败"""
-        from player.player import MusicPlayer
+        steps = [player.volume_up() for _ in range(10)]
 
-        mock_mixer.music.pause.side_effect = Exception("Error")
+        assert steps == [i / 10 for i in range(1, 11)]
+        assert [int(v * 100) for v in steps] == list(range(10, 101, 10))
 
-        player = MusicPlayer()
-        result = player.pause()
+    def test_volume_percent(self, player):
+        """测试 volume_percent 返回保存的整数百分比，不受浮点换算截断影响"""
+        player.set_volume(0.29)
 
-        assert result is False
+        assert player.volume_percent == 29
+        assert int(player.volume * 100) == 28  # 浮点换算会少 1%，展示时应使用 volume_percent
 
+    def test_init_uses_slots(self, player):
+        """测试播放器实例使用 __slots__，没有 __dict__"""
+        assert not hasattr(player, '__dict__')
+        with pytest.raises(AttributeError):
+            player.unknown_attribute = 1
 
-class TestMusicPlayerResume:
-    """恢复播放测试类"""
 
-    @patch('player.player.pygame.mixer')
-    def test_resume_success(self, mock_mixer):
-        """测试恢复播放成功"""
-        from player.player import MusicPlayer
+class TestMusicPlayerControl:
+    """加载/播放/暂停/恢复/停止测试类"""
 
-        player = MusicPlayer()
-        player.is_paused = True
+    @pytest.mark.parametrize("method, args, mixer_attr, before, after", [
+        ("load", ('/path/to/song.mp3',), "load", {}, {'current_track': '/path/to/song.mp3'}),
+        ("play", (), "play", {}, {'is_playing': True, 'is_paused': False}),
+        ("pause", (), "pause", {}, {'is_paused': True}),
+        ("resume", (), "unpause", {'is_paused': True}, {'is_paused': False}),
+        ("stop", (), "stop", {'is_playing': True, 'is_paused': False},
+         {'is_playing': False, 'is_paused': False}),
+    ])
+    def test_success(self, player, mock_mixer, method, args, mixer_attr, before, after):
+        """测试操作成功：调用对应的 mixer 方法并更新播放状态"""
+        for name, value in before.items():
+            setattr(player, name, value)
 
-        result = player.resume()
+        result = getattr(player, method)(*args)
 
         assert result is True
-        assert player.is_paused is False
-        mock_mixer.music.unpause.assert_called_once()
-
-    @patch('player.player.pygame.mixer')
-    def test_resume_failure(self, mock_mixer):
-        """测试恢复播放失败"""
-        from player.player import MusicPlayer
-
-        mock_mixer.music.unpause.side_effect = Exception("Error")
-
-        player = MusicPlayer()
-        result = player.resume()
-
-        assert result is False
-
-
-class TestMusicPlayerStop:
-    """停止播放测试类"""
-
-    @patch('player.player.pygame.mixer')
-    def test_stop_success(self, mock_mixer):
-        """测试停止成功"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        player.is_playing = True
-        player.is_paused = False
-
-        result = player.stop()
-
-        assert result is True
-        assert player.is_playing is False
-        assert player.is_paused is False
-        mock_mixer.music.stop.assert_called_once()
-
-    @patch('player.player.pygame.mixer')
-    def test_stop_failure(self, mock_mixer):
-        """测试停止失败"""
-        from player.player import MusicPlayer
-
-        mock_mixer.music.stop.side_effect = Exception("Error")
-
-        player = MusicPlayer()
-        result = player.stop()
+        for name, value in after.items():
+            assert getattr(player, name) == value
+        getattr(mock_mixer.music, mixer_attr).assert_called_once_with(*args)
+
+    @pytest.mark.parametrize("method, args, mixer_attr", [
+        ("load", ('/path/to/invalid.mp3',), "load"),
+        ("play", (), "play"),
+        ("pause", (), "pause"),
+        ("resume", (), "unpause"),
+        ("stop", (), "stop"),
+    ])
+    def test_failure(self, player, mock_mixer, method, args, mixer_attr):
+        """测试 mixer 抛出异常时操作返回 False"""
+        getattr(mock_mixer.music, mixer_attr).side_effect = Exception("Error")
+
+        result = getattr(player, method)(*args)
 
         assert result is False
 
@@ -196,93 +134,50 @@ class TestMusicPlayerStop:
 class TestMusicPlayerNextPrevious:
     """下一首/上一首测试类"""
 
-    @patch('player.player.pygame.mixer')
-    def test_next_with_playlist(self, mock_mixer):
+    def test_next_with_playlist(self, player, tracks, skip_playback):
         """测试下一首（有播放列表）"""
-        from player.player import MusicPlayer
-
-        # 创建模拟播放列表
-        track1 = MagicMock()
-        track1.file_path = '/path/song1.mp3'
-        track2 = MagicMock()
-        track2.file_path = '/path/song2.mp3'
-
-        player = MusicPlayer()
-        player.playlist = [track1, track2]
+        player.playlist = tracks[:2]
         player.current_index = 0
 
-        with patch.object(player, 'play_current', return_value=True):
-            result = player.next()
+        result = player.next()
 
         assert result is True
         assert player.current_index == 1
 
-    @patch('player.player.pygame.mixer')
-    def test_next_loop_back(self, mock_mixer):
+    def test_next_loop_back(self, player, tracks, skip_playback):
         """测试下一首循环回到开头"""
-        from player.player import MusicPlayer
-
-        track1 = MagicMock()
-        track1.file_path = '/path/song1.mp3'
-
-        player = MusicPlayer()
-        player.playlist = [track1]
+        player.playlist = tracks[:1]
         player.current_index = 0
 
-        with patch.object(player, 'play_current', return_value=True):
-            result = player.next()
+        result = player.next()
 
         assert result is True
         assert player.current_index == 0  # 循环回到开头
 
-    @patch('player.player.pygame.mixer')
-    def test_next_empty_playlist(self, mock_mixer):
+    def test_next_empty_playlist(self, player):
         """测试下一首（空播放列表）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
         player.playlist = []
 
         result = player.next()
 
         assert result is False
 
-    @patch('player.player.pygame.mixer')
-    def test_previous_with_playlist(self, mock_mixer):
+    def test_previous_with_playlist(self, player, tracks, skip_playback):
         """测试上一首（有播放列表）"""
-        from player.player import MusicPlayer
-
-        track1 = MagicMock()
-        track1.file_path = '/path/song1.mp3'
-        track2 = MagicMock()
-        track2.file_path = '/path/song2.mp3'
-
-        player = MusicPlayer()
-        player.playlist = [track1, track2]
+        player.playlist = tracks[:2]
         player.current_index = 1
 
-        with patch.object(player, 'play_current', return_value=True):
-            result = player.previous()
+        result = player.previous()
 
         assert result is True
         assert player.current_index == 0
 
-    @patch('player.player.pygame.mixer')
-    def test_previous_loop_to_end(self, mock_mixer):
+    def test_previous_loop_to_end(self, player, tracks, skip_playback):
         """测试上一首循环到末尾"""
-        from player.player import MusicPlayer
-
-        track1 = MagicMock()
-        track1.file_path = '/path/song1.mp3'
-        track2 = MagicMock()
-        track2.file_path = '/path/song2.mp3'
-
-        player = MusicPlayer()
-        player.playlist = [track1, track2]
+        player.playlist = tracks[:2]
         player.current_index = 0
 
-        with patch.object(player, 'play_current', return_value=True):
-            result = player.previous()
+        result = player.previous()
 
         assert result is True
         assert player.current_index == 1  # 循环到末尾
@@ -291,149 +186,85 @@ class TestMusicPlayerNextPrevious:
 class TestMusicPlayerPlaylist:
     """播放列表测试类"""
 
-    @patch('player.player.pygame.mixer')
-    def test_set_playlist(self, mock_mixer):
+    def test_set_playlist(self, player, tracks):
         """测试设置播放列表"""
-        from player.player import MusicPlayer
-
-        track1 = MagicMock()
-        track2 = MagicMock()
-
-        player = MusicPlayer()
-        player.set_playlist([track1, track2])
+        player.set_playlist(tracks[:2])
 
         assert len(player.playlist) == 2
         assert player.current_index == 0
 
-    @patch('player.player.pygame.mixer')
-    def test_play_all(self, mock_mixer):
+    def test_play_all(self, player, tracks, skip_playback):
         """测试播放全部"""
-        from player.player import MusicPlayer
+        player.playlist = tracks[:1]
 
-        track1 = MagicMock()
-        track1.file_path = '/path/song1.mp3'
-
-        player = MusicPlayer()
-        player.playlist = [track1]
-
-        with patch.object(player, 'play_current', return_value=True):
-            result = player.play_all()
+        result = player.play_all()
 
         assert result is True
         assert player.current_index == 0
 
-    @patch('player.player.pygame.mixer')
-    def test_play_all_empty_playlist(self, mock_mixer):
+    def test_play_all_empty_playlist(self, player):
         """测试播放全部（空列表）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
         player.playlist = []
 
         result = player.play_all()
 
         assert result is False
 
+    def test_shuffle_play_keeps_playlist_order(self, player, tracks):
+        """测试随机播放只打乱播放顺序，不改变播放列表"""
+        player.set_playlist(list(tracks))
+        result = player.shuffle_play()
 
-class TestMusicPlayerVolume:
-    """音量控制测试类"""
-
-    @patch('player.player.pygame.mixer')
-    def test_set_volume_in_range(self, mock_mixer):
-        """测试设置音量（在有效范围内）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        result = player.set_volume(0.5)
-
-        assert result == 0.5
-        mock_mixer.music.set_volume.assert_called_with(0.5)
-
-    @patch('player.player.pygame.mixer')
-    def test_set_volume_above_max(self, mock_mixer):
-        """测试设置音量（超过最大值）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        result = player.set_volume(1.5)
-
-        assert result == 1.0  # 应该被限制到 1.0
-        mock_mixer.music.set_volume.assert_called_with(1.0)
-
-    @patch('player.player.pygame.mixer')
-    def test_set_volume_below_min(self, mock_mixer):
-        """测试设置音量（低于最小值）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        result = player.set_volume(-0.5)
-
-        assert result == 0.0  # 应该被限制到 0.0
-        mock_mixer.music.set_volume.assert_called_with(0.0)
-
-    @patch('player.player.pygame.mixer')
-    def test_volume_up(self, mock_mixer):
-        """测试增加音量"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        player.volume = 0.5
-
-        result = player.volume_up()
-
-        assert result == 0.6
-
-    @patch('player.player.pygame.mixer')
-    def test_volume_up_at_max(self, mock_mixer):
-        """测试增加音量（已达最大值）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        player.volume = 1.0
-
-        result = player.volume_up()
-
-        assert result == 1.0  # 保持在最大值
-
-    @patch('player.player.pygame.mixer')
-    def test_volume_down(self, mock_mixer):
-        """测试降低音量"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-        player.volume = 0.5
-
-        result = player.volume_down()
-
-        assert result == 0.4
+        assert result is True
+        assert player.playlist == tracks
+        # 依次播放完一轮，每首歌恰好播放一次
+        played = [player.current_track]
+        for _ in range(4):
+            player.next()
+            played.append(player.current_track)
+        assert sorted(played) == sorted(t.file_path for t in tracks)
 
-    @patch('player.player.pygame.mixer')
-    def test_volume_down_at_min(self, mock_mixer):
-        """测试降低音量（已达最小值）"""
-        from player.player import MusicPlayer
+        # 切回顺序播放
+        player.play_all()
+        assert player.current_track == '/path/song0.mp3'
 
-        player = MusicPlayer()
-        player.volume = 0.0
 
-        result = player.volume_down()
+class TestMusicPlayerVolume:
+    """音量控制测试类"""
 
-        assert result == 0.0  # 保持在最小值
+    @pytest.mark.parametrize("initial, method, args, expected", [
+        (None, "set_volume", (0.5,), 0.5),    # 在有效范围内
+        (None, "set_volume", (1.5,), 1.0),    # 超过最大值，限制到 1.0
+        (None, "set_volume", (-0.5,), 0.0),   # 低于最小值，限制到 0.0
+        (0.5, "volume_up", (), 0.6),
+        (1.0, "volume_up", (), 1.0),          # 已达最大值，保持不变
+        (0.5, "volume_down", (), 0.4),
+        (0.0, "volume_down", (), 0.0),        # 已达最小值，保持不变
+        (0.7, "volume_up", (), 0.8),          # 0.7 + 0.1 不应产生浮点误差
+        (0.3, "volume_down", (), 0.2),
+    ])
+    def test_volume(self, player, mock_mixer, initial, method, args, expected):
+        """测试设置/增加/降低音量（结果限制在 0.0 ~ 1.0）"""
+        if initial is not None:
+            player.volume = initial
+
+        result = getattr(player, method)(*args)
+
+        assert result == expected
+        assert player.volume == expected
+        mock_mixer.music.set_volume.assert_called_with(expected)
 
 
 class TestMusicPlayerStatus:
     """状态查询测试类"""
 
-    @patch('player.player.pygame.mixer')
-    def test_get_status(self, mock_mixer):
+    def test_get_status(self, player, tracks):
         """测试获取状态"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
         player.is_playing = True
         player.is_paused = False
         player.current_track = '/path/song.mp3'
         player.volume = 0.7
-        player.playlist = [MagicMock(), MagicMock()]
+        player.playlist = tracks[:2]
         player.current_index = 1
 
         status = player.get_status()
@@ -445,39 +276,49 @@ class TestMusicPlayerStatus:
         assert status['playlist_size'] == 2
         assert status['current_index'] == 1
 
-    @patch('player.player.pygame.mixer')
-    def test_get_current_track_info_no_track(self, mock_mixer):
+    def test_get_current_track_info_no_track(self, player):
         """测试获取当前曲目信息（无曲目）"""
-        from player.player import MusicPlayer
-
-        player = MusicPlayer()
-
         with patch('player.player.db') as mock_db:
             mock_db.get_music_by_title.return_value = []
             result = player.get_current_track_info()
 
         assert result is None
 
-    @patch('player.player.pygame.mixer')
-    def test_is_busy(self, mock_mixer):
-        """测试检查忙碌状态"""
-        from player.player import MusicPlayer
+    def test_get_current_track_info_from_played_track(self, player, tracks):
+        """测试播放曲目后直接返回曲目对象，不查询数据库"""
+        track = tracks[0]
+        player.play_track(track)
+
+        with patch('player.player.db') as mock_db:
+            result = player.get_current_track_info()
 
+        assert result is track
+        mock_db.get_music_by_title.assert_not_called()
+
+    def test_get_current_track_info_cached(self, player):
+        """测试从数据库查询的曲目信息会被缓存"""
+        player.load('/path/song.mp3')
+        music = MagicMock()
+
+        with patch('player.player.db') as mock_db:
+            mock_db.get_music_by_title.return_value = [music]
+            assert player.get_current_track_info() is music
+            assert player.get_current_track_info() is music
+
+        mock_db.get_music_by_title.assert_called_once_with('song')
+
+    def test_is_busy(self, player, mock_mixer):
+        """测试检查忙碌状态"""
         mock_mixer.music.get_busy.return_value = 1
 
-        player = MusicPlayer()
         result = player.is_busy()
 
         assert result is True
 
-    @patch('player.player.pygame.mixer')
-    def test_is_busy_not_playing(self, mock_mixer):
+    def test_is_busy_not_playing(self, player, mock_mixer):
         """测试检查忙碌状态（未播放）"""
-        from player.player import MusicPlayer
-
         mock_mixer.music.get_busy.return_value = 0
 
-        player = MusicPlayer()
         result = player.is_busy()
 
         assert result is False